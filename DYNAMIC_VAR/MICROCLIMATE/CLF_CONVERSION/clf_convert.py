@@ -0,0 +1,130 @@
+# PURPOSE: CONVERTS A MIXED FOLDER OF RAW LOGGER FILES (TOMST TMS4, TL, SURVEYTAG) INTO CLF AND EXPORTS FIGURES
+# the logger type is identified from the first lines of each file (logger_formats.py) and the file is
+# dispatched to the parser of that type, so every file is read once and nothing depends on the file name
+
+import os
+import sys
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from logger_formats import identify, parse, clf_stem_for
+from surveytag_battery import battery_from_head_tail
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import write_clf
+from clf_figures import create_clf_figure
+from file_manifest import load_manifest, save_manifest, check_file, manifest_entry
+
+#####################
+# SOURCE & SETTINGS #
+#####################
+source_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\1_CLF_conversion\source" # input path, any mix of raw logger files
+output_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\1_CLF_conversion\output" # output path for CLF files
+figure_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\1_CLF_conversion\figures" # output path for figures
+settings = {
+    "date_gate": "2024-03-01", # TOMST: start of the study, earlier rows are skipped while reading
+    "timezone": "Europe/Helsinki", # SurveyTag: local time of the computer the loggers were set up with
+    "ambiguous": "infer", # SurveyTag: repeated hour when clocks go back (see local_time.py)
+    "nonexistent": "shift_1h", # SurveyTag: skipped hour when clocks go forward
+    "export_csv": False, # also write the legacy CLF .csv next to the CLF v2 .parquet
+}
+n_workers = os.cpu_count() # number of parallel worker processes, 1 = run sequentially without a pool
+incremental = True # only convert files that are new or changed since the last run, False = convert everything
+manifest_name = "conversion_manifest_mixed.csv" # own manifest so the type specific converters can share the output folder
+
+#######################
+# CLF CONVERSION      #
+#######################
+# identifies, parses and exports a single raw file, returns a manifest row (logger_type None = unknown format)
+# defined on module level so the worker processes can pickle it
+# a file that fails returns its error instead of stopping the whole run
+def convert_file(filename, source_folder, output_folder, figure_folder, settings):
+    try:
+        file_path = os.path.join(source_folder, filename)
+        logger_type = identify(file_path)
+        if logger_type is None:
+            return {"source": filename, "logger_type": None}
+        df, logger_type, info = parse(file_path, logger_type, settings)
+        clf_stem = clf_stem_for(filename, logger_type)
+        new_file_path = write_clf(df, os.path.join(output_folder, f"{clf_stem}.parquet"), export_csv=settings["export_csv"])
+        figure_path = create_clf_figure(df, logger_type, filename, os.path.join(figure_folder, f"{clf_stem}_fig.html"))
+        return {
+            "source": filename,
+            "clf": new_file_path,
+            "figure": figure_path,
+            "logger_type": logger_type,
+            "rows": len(df),
+            **info,
+        }
+    except Exception as e:
+        return {"source": filename, "error": f"{type(e).__name__}: {e}"}
+
+#######################
+# CLF CONVERSION LOOP #
+#######################
+# runs convert_file over every .csv in the source folder, in parallel if n_workers > 1
+# progress is printed in file order, files of unknown format are reported and left alone
+# failed files stay out of the manifest and are tried again next run, the manifest is saved even if the run stops
+def convert_folder(source_folder, output_folder, figure_folder, settings, n_workers=1, incremental=True):
+    files = sorted(f for f in os.listdir(source_folder) if f.lower().endswith('.csv'))
+    previous = load_manifest(output_folder, manifest_name) if incremental else {}
+
+    manifest = {}
+    battery = []
+    todo = []
+    for filename in files:
+        file_path = os.path.join(source_folder, filename)
+        up_to_date, entry = check_file(previous.get(filename), file_path, settings)
+        if up_to_date:
+            manifest[filename] = entry
+            if entry["logger_type"] == 'ST':
+                battery.append(battery_from_head_tail(file_path))
+        else:
+            todo.append(filename)
+    print(f"{len(todo)} of {len(files)} files new or changed, {len(manifest)} up to date")
+
+    worker = partial(convert_file,
+                     source_folder=source_folder,
+                     output_folder=output_folder,
+                     figure_folder=figure_folder,
+                     settings=settings)
+
+    if n_workers is None or n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(worker, todo) # map yields in submission order
+    else:
+        pool = None
+        results = map(worker, todo)
+    failed = 0
+    try:
+        for i, row in enumerate(results, start=1):
+            source = row.pop("source")
+            if "error" in row:
+                failed += 1
+                print(f"[{i}/{len(todo)}] FAILED {source}: {row['error']}")
+                continue
+            if row["logger_type"] is None:
+                print(f"[{i}/{len(todo)}] {source}: unknown logger format, skipped")
+                continue
+            if "battery" in row:
+                battery.append(row.pop("battery"))
+            for transition in row.pop("dst_report", []): # report rows that fell into a DST transition
+                print(f"{source}: {transition['rows']} {transition['kind']} local times on {transition['transition']}, handled as {transition['policy']}")
+            manifest[source] = manifest_entry(os.path.join(source_folder, source), settings, **row)
+            print(f"[{i}/{len(todo)}] {source}: {row['logger_type']} CLF and figure exported")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        manifest_path = save_manifest(manifest.values(), output_folder, manifest_name)
+        print(f"Manifest exported: {manifest_path}")
+
+    if failed:
+        print(f"{failed} of {len(todo)} files FAILED, they are converted again next run")
+    if battery: # SurveyTag battery drainage report
+        battery_path = os.path.join(output_folder, "battery_drainage_report.csv")
+        pd.DataFrame(battery).sort_values("logger").to_csv(battery_path, index=False)
+        print(f"Battery drainage report exported: {battery_path}")
+    return manifest
+
+# guard is required for the process pool (workers re-import this script on windows)
+if __name__ == "__main__":
+    convert_folder(source_folder, output_folder, figure_folder, settings, n_workers=n_workers, incremental=incremental)
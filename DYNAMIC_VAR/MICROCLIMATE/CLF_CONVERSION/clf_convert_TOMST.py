@@ -1,12 +1,14 @@
 # PURPOSE: CONVERTS TOMST TMS4 AND TL DATA INTO A SHARED LOGGER FORMAT (CLF) AND EXPORTS FIGURES
 
 import os
-import pandas as pd
-import geopandas as gpd
-import plotly as plt 
-import plotly.graph_objects as go
-import numpy as np
-import warnings
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from tomst_reader import read_tomst, tomst_to_clf, tomst_clf_stem
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import write_clf
+from clf_figures import create_clf_figure
+from file_manifest import load_manifest, save_manifest, check_file, manifest_entry
 
 #####################
 # SOURCE & SETTINGS #
@@ -15,59 +17,23 @@ source_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\pro
 output_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\1_CLF_conversion\output" # output path for CLF.csvs
 figure_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\1_CLF_conversion\figures" # output path for figures
 date_gate = "2024-03-01" # put in the start of your study date to reduce the amount of data the loop iterates over
+export_csv = False # also write the legacy CLF .csv next to the CLF v2 .parquet
+n_workers = os.cpu_count() # number of parallel worker processes, 1 = run sequentially without a pool
+incremental = True # only convert files that are new or changed since the last run, False = convert everything
 #deviation_threshold = 0.6 # deviation threshold for the 2nd date gate which tries to find the start of the time series
 
 #######################
-# CLF CONVERSION LOOP #
+# CLF CONVERSION      #
 #######################
-for filename in os.listdir(source_folder):
-    # COMMON PART 1 # 
-    if filename.endswith('.csv') and 'data' in filename.lower(): # if its a csv file that contains the word data (TOMST standard)
+# converts a single TOMST file to CLF and exports its figure, returns a manifest row
+# defined on module level so the worker processes can pickle it
+# a file that fails returns its error instead of stopping the whole run
+def convert_file(filename, source_folder, output_folder, figure_folder, date_gate, export_csv=False):
+    try:
+        # COMMON PART 1 # 
         file_path = os.path.join(source_folder, filename)
-        df = pd.read_csv(file_path, sep = ";", dayfirst = True, header = None, index_col=[0]) 
-        #df[1] = pd.to_datetime(df[1], dayfirst=True, errors='coerce') # redundant datetime coercian
-        df = df.rename(columns = {
-            1: 'datetime',
-            2: 'utc',
-            3: 't1',
-            4: 't2',
-            5: 't3',
-            6: 'SMC',
-            7: 'shake',
-            8: 'errFlag',
-            9: 'bs'
-        }) # rename columns
-        df['datetime'] = pd.to_datetime(df['datetime'], format="%Y.%m.%d %H:%M") #datetime parser
-        df = df[df['datetime'] >= pd.to_datetime(date_gate)] # apply first date gate
-        df['datetime'] = df['datetime'].dt.tz_localize('UTC') # assign UTC timezone to datetime
-        if (df['errFlag'] == 0).all(): # drop error flag column if 0 in every row
-            df = df.drop(columns=['errFlag'])
-        else:
-                non_zero_count = (df['errFlag'] != 0).sum()
-                warnings.warn(f"'errFlag' had {non_zero_count} non-zero rows. These rows were dropped.")
-                df = df[df['errFlag'] == 0].copy()
-                df = df.drop(columns=['errFlag'])
-
-        # DETECT LOGGER TYPE AND MANIPULATE BASED ON DIFFERENCES
-        if df[['t1', 't2', 'SMC']].isin([-200]).all().any():  # values in some columns are -200 = TL
-            logger_type = 'TL'
-            logcode = 2
-            df = df.rename(columns={
-                't1': 't3',
-                't3': 't1',
-            }) # tomst inconsistent in storage formatting
-            # df['logtype'] = logcode # assign logger code maybe just unnecessary clutter since its in the name
-            df[['t1', 't2', 'SMC']] = np.nan # fill CLF commons with nans
-            df = df.reindex(['datetime', 't1', 't2', 't3', 'SMC'], axis=1)
-
-        else: # else its a TMS
-            logger_type = 'TMS'
-            logcode = 1
-            df = df.drop(columns=['utc', 'shake', 'bs'])
-            # df['logtype'] = logcode
-            columns_to_convert = ['t1', 't2', 't3']
-            if df[columns_to_convert].applymap(type).eq(str).any().any():
-                df[columns_to_convert] = df[columns_to_convert].apply(lambda x: x.str.replace(',', '.').astype(float))
+        df = read_tomst(file_path, date_gate=date_gate) # streams the file, applies first date gate and parses numbers and datetime
+        df, logger_type = tomst_to_clf(df, filename=filename) # drops error rows, detects TL/TMS, TL columns are swapped and filled with nans
 
         # COMMON PART 2 # 
         #dfsd = df.copy() # deviation filtering gate
@@ -75,45 +41,81 @@ for filename in os.listdir(source_folder):
         #dfsd['rolling_std_long'] = dfsd['rolling_std_shrt'].rolling(window=10).mean() # std deviation over 10 days
         #date_gate2 = dfsd[dfsd['rolling_std_long'] > deviation_threshold]['datetime'].min() # find first date in which the std deviation of 10 days exceeds the deviation threshold from the 3 days 
         #df = df[df['datetime'] >= pd.to_datetime(date_gate2)] # apply deviation filtering gate
-        cleaned_filename = filename.replace("data", "").strip("_") 
-        new_filename = f"CLF_{cleaned_filename[:-6]}_{logger_type}.csv"
-        new_file_path = os.path.join(output_folder, new_filename)
-        df.to_csv(new_file_path, index=False)
-        print(f"{filename}: CLF format exported, proceed to Figure!")
-        
+        clf_stem = tomst_clf_stem(filename, logger_type)
+        new_filename = f"{clf_stem}.parquet"
+        new_file_path = write_clf(df, os.path.join(output_folder, new_filename), export_csv=export_csv)
+    
         # FIGURES
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=df['datetime'], y=df['t3'], mode='lines', name='T air'))
-        if logger_type == 'TMS':  # Add more traces for TMS
-            fig.add_trace(go.Scatter(x=df['datetime'], y=df['t2'], mode='lines', name='T surface'))
-            fig.add_trace(go.Scatter(x=df['datetime'], y=df['t1'], mode='lines', name='T soil'))
-        fig.update_layout(
-            shapes=[dict(
-                type="rect",
-                xref="x", yref="paper",
-                x0="2024-05-15", x1="2024-09-15",
-                y0=0, y1=1,
-                fillcolor="yellow", opacity=0.2, line_width=0,
-            )],
-            annotations=[dict(
-                x='2024-07-15',
-                y=1.05,
-                xref='x',
-                yref='paper',
-                text='Summer 24',
-                showarrow=False,
-                font=dict(size=14, color="yellow"),
-                align="center"
-            )],
-            title=f"{'Air temperature' if logger_type == 'TL' else 'Soil, surface, air temperature'}, {filename}",
-            xaxis_title='Date',
-            yaxis_title='Temperature (°C)',
-            hovermode='x unified',
-            template='plotly_dark',
-            height=700,
-            width=1200
-        )
-        figure_name = f"CLF_{cleaned_filename[:-6]}_{logger_type}_fig.html"
-        figure_path = os.path.join(figure_folder, figure_name)
-        fig.write_html(figure_path)
-        print(f"{filename}: Figure exported, proceed to next!")
\ No newline at end of file
+        figure_path = create_clf_figure(df, logger_type, filename, os.path.join(figure_folder, f"{clf_stem}_fig.html"))
+
+        return {
+            "source": filename,
+            "clf": new_file_path,
+            "figure": figure_path,
+            "logger_type": logger_type,
+            "rows": len(df),
+        }
+    except Exception as e:
+        return {"source": filename, "error": f"{type(e).__name__}: {e}"}
+
+#######################
+# CLF CONVERSION LOOP #
+#######################
+# runs convert_file over every TOMST file in the source folder, in parallel if n_workers > 1
+# progress is printed in file order, the manifest lists produced CLF files and detected logger types
+# with incremental=True only new or changed files (or files converted with other settings) are converted again
+# failed files stay out of the manifest and are tried again next run, the manifest is saved even if the run stops
+def convert_folder(source_folder, output_folder, figure_folder, date_gate, n_workers=1, export_csv=False, incremental=True):
+    files = sorted(
+        f for f in os.listdir(source_folder)
+        if f.endswith('.csv') and 'data' in f.lower() # if its a csv file that contains the word data (TOMST standard)
+    )
+    settings = {"date_gate": date_gate, "timezone": "UTC", "export_csv": export_csv}
+    previous = load_manifest(output_folder) if incremental else {}
+
+    manifest = {}
+    todo = []
+    for filename in files:
+        up_to_date, entry = check_file(previous.get(filename), os.path.join(source_folder, filename), settings)
+        if up_to_date:
+            manifest[filename] = entry
+        else:
+            todo.append(filename)
+    print(f"{len(todo)} of {len(files)} files new or changed, {len(manifest)} up to date")
+
+    worker = partial(convert_file,
+                     source_folder=source_folder,
+                     output_folder=output_folder,
+                     figure_folder=figure_folder,
+                     date_gate=date_gate,
+                     export_csv=export_csv)
+
+    if n_workers is None or n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(worker, todo) # map yields in submission order
+    else:
+        pool = None
+        results = map(worker, todo)
+    failed = 0
+    try:
+        for i, row in enumerate(results, start=1):
+            source = row.pop("source")
+            if "error" in row:
+                failed += 1
+                print(f"[{i}/{len(todo)}] FAILED {source}: {row['error']}")
+                continue
+            manifest[source] = manifest_entry(os.path.join(source_folder, source), settings, **row)
+            print(f"[{i}/{len(todo)}] {source}: {row['logger_type']} CLF and figure exported")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        manifest_path = save_manifest(manifest.values(), output_folder)
+        print(f"Manifest exported: {manifest_path}")
+
+    if failed:
+        print(f"{failed} of {len(todo)} files FAILED, they are converted again next run")
+    return manifest
+
+# guard is required for the process pool (workers re-import this script on windows)
+if __name__ == "__main__":
+    convert_folder(source_folder, output_folder, figure_folder, date_gate, n_workers=n_workers, export_csv=export_csv, incremental=incremental)
@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 import geopandas as gpd
 import plotly as plt 
@@ -6,6 +7,12 @@ import plotly.graph_objects as go
 import numpy as np
 import pytz
 import warnings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import write_clf
+from clf_figures import create_clf_figure
+from file_manifest import load_manifest, save_manifest, check_file, manifest_entry
+from surveytag_reader import read_surveytag, surveytag_to_clf, surveytag_clf_stem
+from surveytag_battery import battery_from_frame, battery_from_head_tail
 
 #####################
 # SOURCE & SETTINGS #
@@ -16,101 +23,70 @@ figure_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\clf_conve
 # cutoff_date = "2024-03-01" # unnecessary because ST logs only when setup
 logtype = 3 # 1 = TMS, 2 = TL, 3 = ST, 4 = NA
 logger_type = "ST"
+export_csv = False # also write the legacy CLF .csv next to the CLF v2 .parquet
+incremental = True # only convert files that are new or changed since the last run, False = convert everything
+manifest_name = "conversion_manifest_ST.csv" # own manifest in case TOMST output goes to the same folder
 local_tz = pytz.timezone('Europe/Helsinki') # hand initial timezone for UTC conversion, ST record in local time of the computer they have been set up to
+ambiguous_policy = "infer" # repeated hour when clocks go back: infer, standard, dst, NaT, raise (see local_time.py)
+nonexistent_policy = "shift_1h" # skipped hour when clocks go forward: shift_1h, shift_forward, shift_backward, NaT, raise
+battery_only = False # True = skip the conversion and only build the battery report from the first/last lines of each file
 
 #######################
 # CLF CONVERSION LOOP #
 #######################
 # DESC: 1) converts ST data format in CLF, 2) creates interactive .html figures of the data and dumps them into a figures folder, open issues = UTC
 
-for filename in os.listdir(source_folder):
-    if filename.endswith('.csv') and 'SurveyTag' in filename:
-        # IMPORT FILE
-        file_path = os.path.join(source_folder, filename)
-        df = pd.read_csv(file_path, sep = ",", header = 0, skiprows = 3)  
-        # MANIPULATE FILE
-        df['datetime'] = pd.to_datetime(df[['Year', 'Month', 'Day', 'Hour', 'Minute', 'Second']]) # create datetime column
-        df['datetime'] = df['datetime'].apply(lambda x: local_tz.localize(x)) # localize to local timezone
-        df['datetime'] = df['datetime'].dt.tz_convert('UTC')  # convert to UTC
-        df = df.drop(columns = ['Year', 'Month', 'Day', 'Hour', 'Minute', 'Second', 'CJ_Reading', 'vBatt', 'Samples']) #drop unnecessary columns
-        if (df['Fault_Code'] == 0).all(): # drop fault code column if 0, raise error if not
-            df = df.drop(columns=['Fault_Code']) 
-        else:
-            non_zero_count = (df['Fault_Code'] != 0).sum()
-            warnings.warn(f"'errFlag' had {non_zero_count} non-zero rows. These rows were dropped.")
-            df = df[df['Fault_Code'] == 0].copy()
-            df = df.drop(columns=['Fault_Code'])   
-        df= df.rename(columns = { # rename temp readings
-                'TC_Reading':'t3'  }
-                )
-        #df['logtype'] = logtype # kinda unnecessary, could be in name
-        columns_to_replace = ['t1', 't2', 'SMC'] # empty columns for other measurements
-        df[columns_to_replace] = np.nan
-        df = df.reindex(['datetime','t1','t2', 't3', 'SMC', 
-                         #'logtype'
-                         ], axis=1) # rearrange column order to CLF
-        # EXPORT FILE
-        new_filename = f"CLF_{filename[:-4]}_{logger_type}.csv"  # Adding CLF prefix (common logger format) and logger suffix
-        new_file_path = os.path.join(output_folder, new_filename)
-        df.to_csv(new_file_path, index=False)
-        print(f"{filename}: CLF format exported, proceed to Figure!")
-        # PART 2: FIGURES
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=df['datetime'], y=df['t3'], 
-                         mode='lines', name='T air'))
-        fig.update_layout(
-            shapes=[dict( # Summer period
-                        type="rect",
-                        xref="x", yref="paper",
-                        x0="2024-05-15", x1="2024-09-15",
-                        y0=0, y1=1,
-                        fillcolor="yellow", opacity=0.2, line_width=0,
-                    )])
-        fig.update_layout(
-            annotations=[dict(
-                    x='2024-07-15',  # Position the text in the middle of the summer region
-                    y=1.05,  # Position the text above the plot
-                    xref='x',
-                    yref='paper',
-                    text='Summer 24',
-                    showarrow=False,
-                    font=dict(size=14, color="yellow"),  # Set font size and color
-                    align="center"
-                    )])
-        fig.update_layout(title=f'Air temperature, {filename}',
-                  xaxis_title='Date',
-                  yaxis_title='Temperature (°C)',
-                  hovermode='x unified',  # show hover info for both lines on the same x-value
-                  template='plotly_dark',
-                  height=700,   # Adjust this to make the plot taller
-                  width=1200 )  # You can change this to 'plotly_white' if preferred
-        # EXPORT HTML FIGURES
-        figure_name = f"CLF_{filename[:-4]}_{logger_type}_fig.html"  # Adding CLF prefix (common logger format) and logger suffix
-        figure_path = os.path.join(figure_folder, figure_name)
-        fig.write_html(figure_path)
-        print(f"{filename}: Figure exported, proceed to next!")
+settings = {"timezone": local_tz.zone, "ambiguous": ambiguous_policy, "nonexistent": nonexistent_policy, "export_csv": export_csv}
+previous = load_manifest(output_folder, manifest_name) if incremental else {}
+manifest = {}
+battery = [] # battery drainage rows, collected in the same pass
+
+try:
+    for filename in sorted(os.listdir(source_folder)):
+        if filename.endswith('.csv') and 'SurveyTag' in filename:
+            # SKIP UNCHANGED FILES
+            file_path = os.path.join(source_folder, filename)
+            if battery_only:
+                battery.append(battery_from_head_tail(file_path))
+                continue
+            up_to_date, entry = check_file(previous.get(filename), file_path, settings)
+            if up_to_date:
+                manifest[filename] = entry
+                battery.append(battery_from_head_tail(file_path)) # not parsed, first/last lines are enough
+                print(f"{filename}: unchanged since last run, skipped!")
+                continue
+            try: # a file that fails is reported and the others go on, it is converted again next run
+                # IMPORT FILE
+                df = read_surveytag(file_path) # raw table with local time datetime column
+                battery.append(battery_from_frame(filename, df)) # battery report uses local time, as recorded
+                # MANIPULATE FILE
+                df, dst_report = surveytag_to_clf(df, filename, local_tz.zone,
+                                                  ambiguous=ambiguous_policy,
+                                                  nonexistent=nonexistent_policy) # UTC conversion, fault rows dropped, CLF column order
+                for transition in dst_report: # report rows that fell into a DST transition
+                    print(f"{filename}: {transition['rows']} {transition['kind']} local times on {transition['transition']}, handled as {transition['policy']}")
+                # EXPORT FILE
+                new_filename = f"{surveytag_clf_stem(filename, logger_type)}.parquet"  # Adding CLF prefix (common logger format) and logger suffix
+                new_file_path = os.path.join(output_folder, new_filename)
+                new_file_path = write_clf(df, new_file_path, export_csv=export_csv)
+                print(f"{filename}: CLF format exported, proceed to Figure!")
+                # PART 2: FIGURES
+                figure_name = f"{surveytag_clf_stem(filename, logger_type)}_fig.html"  # Adding CLF prefix (common logger format) and logger suffix
+                figure_path = create_clf_figure(df, logger_type, filename, os.path.join(figure_folder, figure_name))
+                print(f"{filename}: Figure exported, proceed to next!")
+                manifest[filename] = manifest_entry(file_path, settings, clf=new_file_path, figure=figure_path,
+                                                    logger_type=logger_type, rows=len(df))
+            except Exception as e:
+                print(f"{filename}: FAILED, {type(e).__name__}: {e}")
+finally:
+    if not battery_only: # converted files keep their entries even if the run stops
+        save_manifest(manifest.values(), output_folder, manifest_name)
 
 ###########################
 # Battery Drainage Report #
 ###########################
 # DESC: Creates .csv report on the difference in battery power recorded by the ST loggers within the time series, exports to 'output_folder'
-
-battery = [] # empty list to append to
-
-for filename in os.listdir(source_folder):
-    if filename.endswith('.csv'):
-        file_path = os.path.join(source_folder, filename)
-        df = pd.read_csv(file_path, sep = ",", header = 0, skiprows = 3)  
-        df['datetime'] = pd.to_datetime(df[['Year', 'Month', 'Day', 'Hour', 'Minute', 'Second']]) # create datetime column for export
-        first_row = df.iloc[0]
-        last_row = df.iloc[-1]
-        difference = first_row['vBatt'] - last_row['vBatt']
-        battery.append({
-                "logger" : filename,
-                "start_date": first_row['datetime'],
-                "end_date": last_row['datetime'],
-                "difference": difference,
-        }) # append to empty list
+# rows are collected in the conversion loop above, files that are not converted only have their first and last lines read
 
 # turn filled list into df and export to output folder
 batterydf = pd.DataFrame(battery)
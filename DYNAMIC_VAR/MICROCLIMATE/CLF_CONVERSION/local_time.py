@@ -0,0 +1,71 @@
+# PURPOSE: VECTORIZED LOCAL TIME -> UTC CONVERSION FOR LOGGERS THAT RECORD IN LOCAL TIME (SURVEYTAG)
+
+import numpy as np
+import pandas as pd
+import pytz
+
+###########################
+# DST POLICIES            #
+###########################
+# ambiguous = local times that happen twice when the clocks go back in autumn (03:00-03:59 in Helsinki)
+#   infer    : use the order of the series, first pass is summer time, second is winter time (default)
+#   standard : always winter time
+#   dst      : always summer time, this is what the old per-row pytz localize ended up doing on pandas timestamps
+#   NaT      : drop the timestamp (NaT)
+#   raise    : stop with an error
+# nonexistent = local times that are skipped when the clocks go forward in spring (03:00-03:59 in Helsinki)
+#   shift_1h       : move one hour forward, keeps the 15 min grid (default, same as the old per-row loop)
+#   shift_forward  : move to the first existing time (04:00)
+#   shift_backward : move to the last existing time (02:59:59.999)
+#   NaT / raise    : as above
+AMBIGUOUS_POLICIES = ("infer", "standard", "dst", "NaT", "raise")
+NONEXISTENT_POLICIES = ("shift_1h", "shift_forward", "shift_backward", "NaT", "raise")
+
+def _ambiguous_arg(policy, n):
+    if policy == "standard":
+        return np.zeros(n, dtype=bool)
+    if policy == "dst":
+        return np.ones(n, dtype=bool)
+    return policy
+
+def _nonexistent_arg(policy):
+    if policy == "shift_1h":
+        return pd.Timedelta("1h")
+    return policy
+
+###########################
+# LOCALIZE TO UTC         #
+###########################
+# localizes naive local timestamps in one vectorized call and converts them to UTC
+# returns the UTC series and a report with the number of affected rows per DST transition
+def localize_to_utc(naive, tz="Europe/Helsinki", ambiguous="infer", nonexistent="shift_1h"):
+    if ambiguous not in AMBIGUOUS_POLICIES:
+        raise ValueError(f"ambiguous must be one of {AMBIGUOUS_POLICIES}, got {ambiguous!r}")
+    if nonexistent not in NONEXISTENT_POLICIES:
+        raise ValueError(f"nonexistent must be one of {NONEXISTENT_POLICIES}, got {nonexistent!r}")
+    naive = pd.Series(pd.to_datetime(naive))
+    n = len(naive)
+
+    # find the affected rows: ambiguous times differ between summer and winter reading, nonexistent ones are NaT in both
+    as_std = naive.dt.tz_localize(tz, ambiguous=np.zeros(n, dtype=bool), nonexistent="NaT")
+    as_dst = naive.dt.tz_localize(tz, ambiguous=np.ones(n, dtype=bool), nonexistent="NaT")
+    ambiguous_mask = as_std.notna() & (as_std != as_dst)
+    nonexistent_mask = as_std.isna() & naive.notna()
+
+    used = ambiguous
+    try:
+        localized = naive.dt.tz_localize(tz, ambiguous=_ambiguous_arg(ambiguous, n), nonexistent=_nonexistent_arg(nonexistent))
+    except (ValueError, pytz.exceptions.InvalidTimeError):
+        if ambiguous != "infer":
+            raise
+        # infer needs the repeated hour to be recorded twice in order, fall back to winter time
+        used = "standard"
+        localized = naive.dt.tz_localize(tz, ambiguous=_ambiguous_arg(used, n), nonexistent=_nonexistent_arg(nonexistent))
+
+    report = []
+    for kind, mask, policy in (("ambiguous", ambiguous_mask, used), ("nonexistent", nonexistent_mask, nonexistent)):
+        if mask.any():
+            counts = naive[mask].dt.date.value_counts().sort_index()
+            for day, rows in counts.items():
+                report.append({"transition": day, "kind": kind, "rows": int(rows), "policy": policy})
+    return localized.dt.tz_convert("UTC"), report
@@ -0,0 +1,69 @@
+# PURPOSE: REGISTRY OF RAW LOGGER FORMATS, IDENTIFIES A FILE FROM ITS FIRST LINES AND PARSES IT INTO CLF
+#
+# every format registers
+#   sniff(lines) -> True/False     decides from the first SNIFF_LINES lines of the file
+#   parse(file_path, settings)     reads the file once and returns (CLF dataframe, logger type, info dict)
+#   stem(filename, logger_type)    CLF file name without extension
+# formats are checked in registration order, so more specific formats go first (TL before TMS)
+# to add a new logger: write a sniff and parse function and call register_format below
+
+import os
+from tomst_reader import read_tomst, sniff_tomst, tomst_to_clf, tomst_clf_stem
+from surveytag_reader import read_surveytag, sniff_surveytag, surveytag_to_clf, surveytag_clf_stem
+from surveytag_battery import battery_from_frame
+
+SNIFF_LINES = 8 # first lines read to identify the format
+LOGGER_FORMATS = {}
+
+def register_format(logger_type, sniff, parse, stem):
+    LOGGER_FORMATS[logger_type] = {"sniff": sniff, "parse": parse, "stem": stem}
+
+#####################
+# IDENTIFY          #
+#####################
+def read_head(file_path, n_lines=SNIFF_LINES):
+    lines = []
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            lines.append(line.rstrip("\r\n"))
+            if len(lines) >= n_lines:
+                break
+    return lines
+
+# returns the logger type of a raw file, or None if no registered format matches
+def identify(file_path, n_lines=SNIFF_LINES):
+    lines = read_head(file_path, n_lines)
+    for logger_type, fmt in LOGGER_FORMATS.items():
+        if fmt["sniff"](lines):
+            return logger_type
+    return None
+
+#####################
+# FORMAT PARSERS    #
+#####################
+# TOMST TMS4 and TL share the file layout, the sniffed type is checked against the data once it is parsed
+def parse_tomst(file_path, logger_type, settings):
+    df = read_tomst(file_path, date_gate=settings.get("date_gate"))
+    df, logger_type = tomst_to_clf(df, logger_type, os.path.basename(file_path))
+    return df, logger_type, {}
+
+def parse_surveytag(file_path, logger_type, settings):
+    filename = os.path.basename(file_path)
+    df = read_surveytag(file_path)
+    battery = battery_from_frame(filename, df)
+    df, dst_report = surveytag_to_clf(df, filename,
+                                      tz=settings.get("timezone", "Europe/Helsinki"),
+                                      ambiguous=settings.get("ambiguous", "infer"),
+                                      nonexistent=settings.get("nonexistent", "shift_1h"))
+    return df, logger_type, {"battery": battery, "dst_report": dst_report}
+
+register_format('TL', lambda lines: sniff_tomst(lines) == 'TL', parse_tomst, tomst_clf_stem)
+register_format('TMS', lambda lines: sniff_tomst(lines) == 'TMS', parse_tomst, tomst_clf_stem)
+register_format('ST', sniff_surveytag, parse_surveytag, surveytag_clf_stem)
+
+# parses a raw file with the registered parser of its logger type
+def parse(file_path, logger_type, settings):
+    return LOGGER_FORMATS[logger_type]["parse"](file_path, logger_type, settings)
+
+def clf_stem_for(filename, logger_type):
+    return LOGGER_FORMATS[logger_type]["stem"](filename, logger_type)
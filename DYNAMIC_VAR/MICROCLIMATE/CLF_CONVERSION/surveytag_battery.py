@@ -0,0 +1,46 @@
+# PURPOSE: BATTERY DRAINAGE ROWS FOR SURVEYTAG LOGGERS, FROM A PARSED FILE OR FROM ITS FIRST AND LAST LINES ONLY
+
+import os
+import pandas as pd
+from surveytag_reader import ST_SKIPROWS, DATE_COLUMNS
+
+TAIL_BYTES = 4096 # how much of the file end is read to find the last record
+
+# one row of the battery drainage report
+def _battery_row(filename, first, last):
+    return {
+        "logger": filename,
+        "start_date": first['datetime'],
+        "end_date": last['datetime'],
+        "difference": first['vBatt'] - last['vBatt'],
+    }
+
+#####################
+# FROM PARSED FILE  #
+#####################
+# used in the conversion loop, df is the raw SurveyTag table with a (local time) datetime column
+def battery_from_frame(filename, df):
+    return _battery_row(filename, df.iloc[0], df.iloc[-1])
+
+#####################
+# FROM HEAD / TAIL  #
+#####################
+# parses one data line into vBatt and the local datetime
+def _parse_line(header, line):
+    values = dict(zip(header, line.strip().split(",")))
+    stamp = pd.Timestamp(*(int(float(values[c])) for c in DATE_COLUMNS))
+    return {"datetime": stamp, "vBatt": float(values['vBatt'])}
+
+# reads only the header, the first record and the last record by seeking from the end of the file
+# cost does not depend on how long the logger has been recording
+def battery_from_head_tail(file_path, skiprows=ST_SKIPROWS, tail_bytes=TAIL_BYTES):
+    with open(file_path, 'rb') as f:
+        for _ in range(skiprows):
+            f.readline()
+        header = [name.strip() for name in f.readline().decode(errors='ignore').strip().split(",")]
+        first = f.readline().decode(errors='ignore')
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - tail_bytes, 0))
+        tail = [line for line in f.read().decode(errors='ignore').splitlines() if line.strip()]
+    return _battery_row(os.path.basename(file_path), _parse_line(header, first), _parse_line(header, tail[-1]))
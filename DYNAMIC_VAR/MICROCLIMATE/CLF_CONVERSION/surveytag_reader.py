@@ -0,0 +1,58 @@
+# PURPOSE: READS RAW SURVEYTAG FILES AND BRINGS THEM INTO CLF, SHARED BY THE SURVEYTAG AND THE UNIFIED CLF CONVERSION
+
+import warnings
+import numpy as np
+import pandas as pd
+from local_time import localize_to_utc
+
+########################
+# SURVEYTAG FILE LAYOUT #
+########################
+ST_SKIPROWS = 3 # SurveyTag files start with 3 lines of logger info before the header
+DATE_COLUMNS = ['Year', 'Month', 'Day', 'Hour', 'Minute', 'Second']
+ST_HEADER_KEYS = ('Year', 'TC_Reading', 'vBatt')
+
+# true if the first lines look like a SurveyTag export, used by the logger format registry
+def sniff_surveytag(lines):
+    if len(lines) <= ST_SKIPROWS:
+        return False
+    header = [name.strip() for name in lines[ST_SKIPROWS].split(',')]
+    return all(key in header for key in ST_HEADER_KEYS)
+
+####################
+# SURVEYTAG READER #
+####################
+# reads the raw table and builds the (naive, local time) datetime column
+def read_surveytag(file_path):
+    df = pd.read_csv(file_path, sep = ",", header = 0, skiprows = ST_SKIPROWS)
+    df['datetime'] = pd.to_datetime(df[DATE_COLUMNS]) # create datetime column
+    return df
+
+#######################
+# SURVEYTAG TO CLF    #
+#######################
+# converts local time to UTC, drops fault rows and brings the table into CLF column layout
+# returns the CLF table and the DST transition report of localize_to_utc
+def surveytag_to_clf(df, filename="", tz="Europe/Helsinki", ambiguous="infer", nonexistent="shift_1h"):
+    df['datetime'], dst_report = localize_to_utc(df['datetime'], tz,
+                                                 ambiguous=ambiguous,
+                                                 nonexistent=nonexistent) # localize to local timezone and convert to UTC
+    df = df.drop(columns = DATE_COLUMNS + ['CJ_Reading', 'vBatt', 'Samples']) #drop unnecessary columns
+    if (df['Fault_Code'] == 0).all(): # drop fault code column if 0, raise error if not
+        df = df.drop(columns=['Fault_Code'])
+    else:
+        non_zero_count = (df['Fault_Code'] != 0).sum()
+        warnings.warn(f"{filename}: 'Fault_Code' had {non_zero_count} non-zero rows. These rows were dropped.")
+        df = df[df['Fault_Code'] == 0].copy()
+        df = df.drop(columns=['Fault_Code'])
+    df= df.rename(columns = { # rename temp readings
+            'TC_Reading':'t3'  }
+            )
+    columns_to_replace = ['t1', 't2', 'SMC'] # empty columns for other measurements
+    df[columns_to_replace] = np.nan
+    df = df.reindex(['datetime','t1','t2', 't3', 'SMC'], axis=1) # rearrange column order to CLF
+    return df, dst_report
+
+# CLF file name without extension, SurveyTag_1001.csv -> CLF_SurveyTag_1001_ST
+def surveytag_clf_stem(filename, logger_type="ST"):
+    return f"CLF_{filename[:-4]}_{logger_type}"
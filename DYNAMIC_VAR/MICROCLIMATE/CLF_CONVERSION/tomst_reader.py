@@ -0,0 +1,152 @@
+# PURPOSE: READS RAW TOMST TMS4 AND TL FILES, SHARED BY THE TOMST CLF CONVERSION
+
+import re
+import warnings
+import numpy as np
+import pandas as pd
+
+#####################
+# TOMST FILE LAYOUT #
+#####################
+# raw TOMST files have no header, column 0 is a running index we do not need
+TOMST_COLUMNS = {
+    1: 'datetime',
+    2: 'utc',
+    3: 't1',
+    4: 't2',
+    5: 't3',
+    6: 'SMC',
+    7: 'shake',
+    8: 'errFlag',
+    9: 'bs'
+}
+TOMST_DATETIME_FORMAT = "%Y.%m.%d %H:%M"
+TEMP_COLUMNS = ['t1', 't2', 't3']
+SNIFF_BYTES = 4096 # how much of the file head is checked for the decimal separator
+CHUNK_ROWS = 100_000 # rows per chunk when streaming a file through the date gate
+
+###########################
+# DECIMAL SEPARATOR SNIFF #
+###########################
+# TOMST lite exports decimal commas or dots depending on the locale of the download computer
+# checks the temperature fields in the first few kilobytes instead of type checking every cell later
+def sniff_decimal(file_path, sniff_bytes=SNIFF_BYTES):
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        head = f.read(sniff_bytes)
+    lines = head.splitlines()[:-1] or head.splitlines() # last line is probably cut off
+    for line in lines:
+        fields = line.split(';')
+        for field in fields[3:6]: # t1, t2, t3
+            if ',' in field:
+                return ','
+            if '.' in field:
+                return '.'
+    return '.' # only integers in the head, pandas default
+
+###################
+# DATE GATE CHUNK #
+###################
+# drops rows before the date gate from a raw chunk, TOMST writes zero padded "YYYY.MM.DD HH:MM"
+# strings which sort like the dates themselves, so the gate is a string comparison and pre-gate rows are never parsed
+def _gate_chunk(chunk, date_gate):
+    stamps = chunk['datetime']
+    gate = date_gate.strftime(TOMST_DATETIME_FORMAT)
+    if stamps.str.len().eq(len(gate)).all():
+        return chunk[stamps >= gate]
+    # unexpected formatting, fall back to parsing this chunk
+    return chunk[pd.to_datetime(stamps, format=TOMST_DATETIME_FORMAT) >= date_gate]
+
+################
+# TOMST READER #
+################
+# reads a raw TOMST file into the CLF column names, numbers are parsed by the csv engine
+# the file is streamed in chunks, rows before date_gate are discarded chunk by chunk so they are never kept in memory
+def read_tomst(file_path, decimal=None, date_gate=None, chunksize=CHUNK_ROWS):
+    if decimal is None:
+        decimal = sniff_decimal(file_path)
+    if date_gate is not None:
+        date_gate = pd.to_datetime(date_gate)
+    reader = pd.read_csv(
+        file_path,
+        sep=";",
+        decimal=decimal,
+        header=None,
+        usecols=list(TOMST_COLUMNS), # skips the running index and the empty trailing field
+        dtype={1: str}, # datetime stays text until after the gate
+        chunksize=chunksize,
+    )
+    chunks = []
+    empty = None
+    with reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=TOMST_COLUMNS)
+            if date_gate is not None:
+                chunk = _gate_chunk(chunk, date_gate)
+            if chunk.empty:
+                empty = chunk # keeps the columns in case everything is gated
+                continue
+            chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True) if chunks else empty
+    # safety net if the head did not reveal the separator, still vectorized per column
+    for col in TEMP_COLUMNS:
+        if df[col].dtype == object:
+            df[col] = df[col].str.replace(',', '.').astype(float)
+    df['datetime'] = pd.to_datetime(df['datetime'], format=TOMST_DATETIME_FORMAT) #datetime parser
+    return df
+
+#######################
+# DETECT LOGGER TYPE  #
+#######################
+# values in some columns are -200 = TL, else its a TMS
+def detect_logger_type(df):
+    if df[['t1', 't2', 'SMC']].isin([-200]).all().any():
+        return 'TL'
+    return 'TMS'
+
+# same decision from the first lines of the raw file, used by the logger format registry
+# returns 'TMS', 'TL' or None if the lines do not look like a TOMST file
+TOMST_LINE = re.compile(r"^\d+;\d{4}\.\d{2}\.\d{2} \d{2}:\d{2};")
+def sniff_tomst(lines):
+    rows = [line.split(';') for line in lines if TOMST_LINE.match(line)]
+    if not rows or len(rows) < len([line for line in lines if line.strip()]):
+        return None
+    for idx in (3, 4, 6): # raw t1, t2, SMC
+        if all(len(row) > idx and row[idx].strip() == '-200' for row in rows):
+            return 'TL'
+    return 'TMS'
+
+#######################
+# TOMST TO CLF        #
+#######################
+# drops error rows and brings a parsed TOMST table into CLF column layout, returns the table and the logger type
+# logger_type=None detects the type from the data, a sniffed type is checked against the data and corrected if wrong
+def tomst_to_clf(df, logger_type=None, filename=""):
+    df['datetime'] = df['datetime'].dt.tz_localize('UTC') # assign UTC timezone to datetime
+    if (df['errFlag'] == 0).all(): # drop error flag column if 0 in every row
+        df = df.drop(columns=['errFlag'])
+    else:
+            non_zero_count = (df['errFlag'] != 0).sum()
+            warnings.warn(f"{filename}: 'errFlag' had {non_zero_count} non-zero rows. These rows were dropped.")
+            df = df[df['errFlag'] == 0].copy()
+            df = df.drop(columns=['errFlag'])
+
+    # DETECT LOGGER TYPE AND MANIPULATE BASED ON DIFFERENCES
+    detected = detect_logger_type(df)
+    if logger_type is not None and logger_type != detected:
+        warnings.warn(f"{filename}: header looked like {logger_type} but the data is {detected}, converted as {detected}.")
+    logger_type = detected
+    if logger_type == 'TL':
+        df = df.rename(columns={
+            't1': 't3',
+            't3': 't1',
+        }) # tomst inconsistent in storage formatting
+        df[['t1', 't2', 'SMC']] = np.nan # fill CLF commons with nans
+        df = df.reindex(['datetime', 't1', 't2', 't3', 'SMC'], axis=1)
+    else: # else its a TMS
+        df = df.drop(columns=['utc', 'shake', 'bs'])
+    return df, logger_type
+
+# CLF file name without extension, data_94290007_2024_11_05_0.csv -> CLF_94290007_2024_11_05_TMS
+def tomst_clf_stem(filename, logger_type):
+    cleaned_filename = filename.replace("data", "").strip("_")
+    return f"CLF_{cleaned_filename[:-6]}_{logger_type}"
@@ -0,0 +1,35 @@
+# PURPOSE: EXPORTS THE QA'D CLF FILES OF ALL SENSORS INTO ONE NETWORK DATASET PARTITIONED BY SENSOR AND MONTH
+# readers then only open the partitions and row groups they need, e.g. in python
+#   read_dataset(DATASET_FOLDER, start="2025-07-01", end="2025-07-31 23:59", columns=["datetime", "t3"])
+# or in R
+#   arrow::open_dataset(DATASET_FOLDER) |> dplyr::filter(month == "2025-07") |> dplyr::collect()
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, list_clf_files, parse_clf_name, write_dataset
+
+#####################
+# SOURCE & SETTINGS #
+#####################
+SOURCE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\3_QA\output" # QA'd CLF files
+DATASET_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\5_dataset" # root of the partitioned dataset
+CONTAINS = ("_QA",) # only export files whose name contains one of these, None = every CLF file
+
+#####################
+# EXPORT LOOP       #
+#####################
+# one sensor per CLF file, re-exporting a sensor replaces all of its partitions
+def export_folder(source_folder, dataset_folder, contains=CONTAINS):
+    os.makedirs(dataset_folder, exist_ok=True)
+    files = list_clf_files(source_folder, contains=contains)
+    for i, file in enumerate(files, start=1):
+        name = parse_clf_name(file)
+        if name is None:
+            print(f"[{i}/{len(files)}] {file}: no serial in file name, skipped")
+            continue
+        df = read_clf(os.path.join(source_folder, file))
+        write_dataset(df, dataset_folder, name["serial"], logger_type=name["logger_type"])
+        print(f"[{i}/{len(files)}] {file}: {len(df)} rows exported as sensor {name['serial']}")
+
+export_folder(SOURCE_FOLDER, DATASET_FOLDER)
@@ -1,9 +1,15 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import plotly as plt 
 import plotly.graph_objects as go
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, write_clf, list_clf_files, clf_name, clf_stem
+from clf_figures import line_trace, write_figure, ensure_plotlyjs
+from results_store import content_hash
+from stage_cache import CACHE_BUDGET, code_version, stage_key, try_store, restore, evict
 
 #####################
 # SOURCE & SETTINGS #
@@ -11,6 +17,18 @@ import plotly.graph_objects as go
 source_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\2_dategate\source" # input path fll with .csv
 output_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\2_dategate\output" # output path for CLF.csvs
 figure_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\2_dategate\figures" # output path for figures
+export_csv = False # also write the legacy CLF .csv next to the CLF v2 .parquet
+cache_folder = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\2_dategate\cache" # unchanged files are restored from here, None = always filter
+cache_stage = "date_filter" # cache sub folder of this script
+code = code_version(__file__) # this script + the SHARED modules it imports, editing either invalidates the cache
+date_filter_params = dict(
+    date_col="datetime",
+    air_col="t3",
+    soil_col="t1",
+    drop_threshold=-5,
+    consecutive_nights=3,
+    day_in_streak=3
+)
 
 #####################
 # FUNCTION DEF #
@@ -93,35 +111,33 @@ def date_filter(
 #####################
 # LOOP FUNCTION #
 #####################
-for filename in os.listdir(source_folder):
-      if filename.endswith(".csv") and ("TMS" in filename.upper() or "TL" in filename.upper()):
+for filename in list_clf_files(source_folder, contains=("TMS", "TL")):
           file_path = os.path.join(source_folder, filename)
-          df = pd.read_csv(file_path, sep = ",", dayfirst = True)
-          df_filtered, cutoff_day = date_filter(
-            df, date_col="datetime",
-            air_col="t3",
-            soil_col="t1",
-            drop_threshold=-5,
-            consecutive_nights=3,
-            day_in_streak=3
-            )
-          new_filename = f"{filename[:-4]}_filtered.csv"
+          # same file content, code and parameters as an earlier run: copy its outputs back and skip
+          key = stage_key(content_hash(file_path), code, {**date_filter_params, "file": filename, "export_csv": export_csv})
+          hit = restore(cache_folder, cache_stage, key,
+                        {"clf": output_folder, "csv": output_folder, "figure": figure_folder}) if cache_folder else None
+          if hit is not None:
+            ensure_plotlyjs(figure_folder)
+            print(f"{filename}: unchanged, restored from cache (cutoff {hit[0]['cutoff_day']})")
+            continue
+          df = read_clf(file_path)
+          df_filtered, cutoff_day = date_filter(df, **date_filter_params)
+          new_filename = clf_name(filename, "_filtered")
           new_file_path = os.path.join(output_folder, new_filename)
           print(df_filtered.head())
           print(df_filtered.dtypes)
-          df_filtered.to_csv(new_file_path, index=False)
+          new_file_path = write_clf(df_filtered, new_file_path, export_csv=export_csv)
           print(f"{filename}: date filtered exported, proceed to Figure!")
           # FIGURES
           fig = go.Figure()
-          fig.add_trace(go.Scatter(x=df['datetime'], y=df['t3'], #original air data
-                         mode='lines', name='Original T air',
+          fig.add_trace(line_trace(df, 't3', name='Original T air', #original air data
                          line=dict(color='gray'), opacity=0.5))
-          fig.add_trace(go.Scatter(x=df_filtered['datetime'], y=df_filtered['t3'], #filtered air data
-                             mode='lines', name='Filtered T air',
+          fig.add_trace(line_trace(df_filtered, 't3', name='Filtered T air', #filtered air data
                              line=dict(color='green')))
           if 'TMS' in filename.upper(): # add other data if TMS
-            fig.add_trace(go.Scatter(x=df_filtered['datetime'], y=df_filtered['t2'], mode='lines', name='T surface'))
-            fig.add_trace(go.Scatter(x=df_filtered['datetime'], y=df_filtered['t1'], mode='lines', name='T soil'))
+            fig.add_trace(line_trace(df_filtered, 't2', name='T surface'))
+            fig.add_trace(line_trace(df_filtered, 't1', name='T soil'))
           fig.add_shape(type="line", x0=cutoff_day, x1=cutoff_day, #cutoff
                   y0=0, y1=1, xref="x", yref="paper",
                   line=dict(color="red", dash="dash"))    
@@ -132,7 +148,12 @@ for filename in os.listdir(source_folder):
               xaxis_title='Date',
               yaxis_title='Temperature (°C)',
               template='plotly_dark')
-          figure_name = f"{filename[:-4]}_filtered_fig.html"
+          figure_name = f"{clf_stem(filename)}_filtered_fig.html"
           figure_path = os.path.join(figure_folder, figure_name)
-          fig.write_html(figure_path)
-          print(f"{filename}: Figure exported, proceed to next!")
\ No newline at end of file
+          write_figure(fig, figure_path)
+          print(f"{filename}: Figure exported, proceed to next!")
+          if cache_folder:
+            try_store(cache_folder, cache_stage, key, {"cutoff_day": cutoff_day},
+                  {"clf": new_file_path, "csv": f"{clf_stem(new_file_path)}.csv" if export_csv else None, "figure": figure_path})
+if cache_folder:
+    evict(cache_folder, CACHE_BUDGET) # least recently used entries beyond the disk budget
\ No newline at end of file
@@ -0,0 +1,179 @@
+# PURPOSE: FILLS t3 GAPS THAT ARE TOO LONG FOR THE QA INTERPOLATION FROM ERA5-LAND t2m AND ssrd
+# the ERA5-Land series of each sensor come from MODELING/01_data/01.2_era5_extract.py (05_era5_variables.parquet:
+# nearest valid grid cell per sensor, t2m in °C, ssrd de-accumulated to W/m²), the same predictors the model is
+# trained on. every long gap is filled from a per hour of day linear model of t3 against t2m and ssrd, fitted on
+# the sensor's valid data around the gap (SHARED/era5_fill.py, all sensors and gaps of a batch at once)
+#
+# filled values are marked in the bool column t3_era5_flag, everything else is left as it came from QA
+# outputs: CLF files with suffix _era5 in OUT_FOLDER and ERA5_fill_report_<time>.csv in REP_FOLDER
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from datetime import datetime
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, write_clf, list_clf_files, clf_name, parse_clf_name
+from era5_fill import NS_PER_HOUR, HOURS, era_to_grid, fill_long_gaps
+
+###################################
+# FILEPATHS & SETTINGS
+###################################
+SOURCE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\5_era5fill\source"
+OUT_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\5_era5fill\output"
+REP_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\5_era5fill\reports"
+ERA_FILE = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\scripts\DATA\modeling\01_traindataprep\05_era5_variables.parquet" # output of 01.2_era5_extract.py
+EXPORT_CSV = False # also write the legacy CLF .csv next to the CLF v2 .parquet
+
+ERA_PREDICTORS = ["t2m", "ssrd"] # columns of ERA_FILE, already in °C and hourly W/m²
+FREQ = "15min"
+MIN_GAP = 20 # rows, shorter gaps are interpolated in QA (t3 fill_limit in SHARED/qa_rules.csv)
+MAX_GAP_DAYS = 14 # longer gaps stay NaN
+WINDOW_DAYS = 14 # valid data used for the model before and after each gap
+MIN_POINTS = 20 # valid rows per hour of day needed to fit the model of that hour
+ERA_BATCH = 32 # sensors stacked at once, memory ~ grid rows x batch x 9 x 16 bytes
+
+REPORT_COLUMNS = ["file", "sensor", "long_gaps", "gaps_filled", "values_filled", "error"]
+
+###################################
+# ERA5 AT THE SENSORS
+###################################
+# hourly ERA5-Land predictors per sensor from the 01.2_era5_extract.py table (sensor_id, time, predictors)
+# de-accumulation happened there per sensor, so interpolating onto the 15 min grid never crosses the 00 UTC reset
+# returns (era stamps in ns, {predictor: (era time x sensor) array}, {serial: column})
+def load_era(era_file):
+    era = pd.read_parquet(era_file, columns=["sensor_id", "time"] + ERA_PREDICTORS)
+    era["sensor_id"] = era["sensor_id"].astype(str)
+    era["time"] = pd.to_datetime(era["time"], utc=True)
+    era = era.drop_duplicates(["sensor_id", "time"])
+    wide = era.pivot(index="time", columns="sensor_id", values=ERA_PREDICTORS).sort_index() # NaN where a sensor has no row
+    sensors = list(wide["t2m"].columns)
+    era_ns = wide.index.as_unit("ns").asi8
+    values = {var: wide[var].reindex(columns=sensors).to_numpy(dtype=float) for var in ERA_PREDICTORS}
+    return era_ns, values, {serial: i for i, serial in enumerate(sensors)}
+
+###################################
+# FILL ONE BATCH OF SENSORS
+###################################
+# frames: {file: CLF frame}, columns: {file: ERA5 column of its sensor}
+# returns {file: (filled frame, stats)}, files without a single row on the FREQ grid (or no rows) are left out
+def fill_batch(frames, columns, era_ns, era_values, step):
+    stamps = {}
+    for file, df in frames.items():
+        ns = pd.to_datetime(df['datetime'], utc=True).dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+        if (ns % step == 0).any():
+            stamps[file] = ns
+    frames = {file: df for file, df in frames.items() if file in stamps}
+    if not frames:
+        return {}
+    t0 = min(ns.min() for ns in stamps.values()) // step * step
+    n = int((max(ns.max() for ns in stamps.values()) - t0) // step) + 1
+    grid_ns = t0 + np.arange(n, dtype=np.int64) * step
+    hour = (grid_ns // NS_PER_HOUR) % HOURS
+
+    # t3 and predictors on the shared grid, rows off the grid are left out of the model and untouched
+    y = np.full((n, len(frames)), np.nan, order='F')
+    cover = np.zeros(y.shape, dtype=bool)
+    slots = {}
+    for s, (file, df) in enumerate(frames.items()):
+        ns = stamps[file]
+        on_grid = (ns - t0) % step == 0
+        slots[file] = (np.flatnonzero(on_grid), (ns[on_grid] - t0) // step)
+        rows, slot = slots[file]
+        y[slot, s] = df['t3'].to_numpy(dtype=float)[rows]
+        cover[slot.min():slot.max() + 1, s] = True
+    era_columns = [columns[file] for file in frames]
+    X = np.stack([era_to_grid(era_ns, era_values[var][:, era_columns], grid_ns) for var in ERA_PREDICTORS], axis=2)
+
+    steps_per_day = pd.Timedelta("1D").value // step
+    filled, stats = fill_long_gaps(y, X, hour, cover, MIN_GAP, MAX_GAP_DAYS * steps_per_day,
+                                   WINDOW_DAYS * steps_per_day, MIN_POINTS)
+
+    results = {}
+    for s, (file, df) in enumerate(frames.items()):
+        rows, slot = slots[file]
+        out = df.copy()
+        t3 = out['t3'].to_numpy(dtype=float, copy=True)
+        flag = np.zeros(len(out), dtype=bool)
+        t3[rows] = y[slot, s]
+        flag[rows] = filled[slot, s]
+        out['t3'] = t3
+        out['t3_era5_flag'] = flag
+        results[file] = (out, {"long_gaps": int(stats[s, 0]), "gaps_filled": int(stats[s, 1]),
+                               "values_filled": int(stats[s, 2])})
+    return results
+
+###################################
+# FILL LOOP
+###################################
+def fill_folder(source_folder, output_folder, report_folder, era_file=ERA_FILE):
+    era_ns, era_values, era_column = load_era(era_file)
+    step = pd.Timedelta(FREQ).value
+
+    # every file that fails gets an error row, the others go on
+    report_rows = []
+    serials = {}
+    def failed(file, e):
+        report_rows.append({"file": file, "sensor": serials.get(file), "error": f"{type(e).__name__}: {e}"})
+        print(f"FAILED {file}: {type(e).__name__}: {e}")
+
+    # read all files first, files that cannot be read or have no ERA5 series get an error row
+    frames = {}
+    columns = {}
+    for file in list_clf_files(source_folder):
+        name = parse_clf_name(file)
+        serials[file] = None if name is None else name["serial"]
+        try:
+            if serials[file] not in era_column:
+                raise ValueError(f"No ERA5 series for sensor {serials[file]} in {era_file}")
+            frames[file] = read_clf(os.path.join(source_folder, file))
+            columns[file] = era_column[serials[file]]
+        except Exception as e:
+            failed(file, e)
+
+    files = list(frames)
+    for b in range(0, len(files), ERA_BATCH):
+        batch = {file: frames[file] for file in files[b:b + ERA_BATCH]}
+        try:
+            results = fill_batch(batch, columns, era_ns, era_values, step)
+        except Exception as e: # one bad sensor, fill the files of this batch one by one
+            print(f"batch {b // ERA_BATCH + 1} failed ({type(e).__name__}: {e}), filling its files one by one")
+            results = {}
+            for file, df in batch.items():
+                try:
+                    results.update(fill_batch({file: df}, columns, era_ns, era_values, step))
+                except Exception as e:
+                    failed(file, e)
+                    results[file] = None
+        for file in batch:
+            if file not in results:
+                failed(file, ValueError(f"no rows on the {FREQ} grid"))
+            elif results[file] is not None:
+                df, stats = results[file]
+                try:
+                    write_clf(df, os.path.join(output_folder, clf_name(file, "_era5")), export_csv=EXPORT_CSV)
+                except Exception as e:
+                    failed(file, e)
+                    continue
+                report_rows.append({"file": file, "sensor": serials[file], **stats, "error": ""})
+                print(f"{file}: {stats['gaps_filled']} of {stats['long_gaps']} long gaps filled "
+                      f"({stats['values_filled']} values)")
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report = pd.DataFrame(report_rows, columns=REPORT_COLUMNS).sort_values("file").reset_index(drop=True)
+    counts = ["long_gaps", "gaps_filled", "values_filled"]
+    report[counts] = report[counts].astype("Int64") # stay integers next to failed rows
+    report_path = os.path.join(report_folder, f"ERA5_fill_report_{timestamp}.csv")
+    report.to_csv(report_path, index=False)
+
+    print("\n====================================")
+    print(f" ERA5 FILL COMPLETE, {report['values_filled'].sum()} VALUES IN {len(files)} FILES")
+    print(f" {report_path}")
+    print("====================================")
+    return report
+
+###################################
+# RUN
+###################################
+if __name__ == "__main__":
+    fill_folder(SOURCE_FOLDER, OUT_FOLDER, REP_FOLDER)
@@ -1,27 +1,43 @@
-import os, glob
+import os, glob, sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, clf_stem, parse_clf_name
+from clf_figures import line_trace, write_figure, write_png
+from qa_rules import RULES_FILE, load_rules, compile_rules
+from rolling_stats import rolling_mad
+from results_store import content_hash, upsert, query
+from stage_cache import CACHE_BUDGET, code_version, stage_key, try_store, restore, evict
 
 # ---------- Config ----------
-RANGES = {'t1': (-40, 60), 't2': (-50, 70), 't3': (-20, 40)}
+# ranges live in SHARED/qa_rules.csv under profile outlier_detection (rows per logger type or sensor override)
+RULES = load_rules(RULES_FILE, profile="outlier_detection")
+RANGES = compile_rules(RULES)['ranges']
 
 # Global jump parameters (applied to all sensors)
 JUMP_PARAMS = dict(win=24, n_sigmas=5, min_abs_jump=5.0, reversal_steps=5)
 
 SUMMARY_CSV = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\outlier_summary.csv"
-INPUT_GLOB = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\source\*_TMS_filtered.csv"
+INPUT_GLOB = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\source\*_TMS_filtered.parquet"
 FIGURES_DIR = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\figures"
+RESULTS_DB = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\qa_results.sqlite"
 
-os.makedirs(FIGURES_DIR, exist_ok=True)
+# everything that changes the outlier counts, a rerun with the same set updates its rows in RESULTS_DB
+OUTLIER_PARAMS = {"rules": RULES.to_dict('records'), "jump_params": JUMP_PARAMS}
 
+EXPORT_PNG = True    # static overview per file (matplotlib, fast)
+EXPORT_HTML = False  # interactive plotly figure per file
+FIGURE_WORKERS = os.cpu_count()  # figures are drawn in their own process pool while detection goes on, 1 = no pool
 
-# ---------- Core logic ----------
-def _rolling_mad(x):
-    m = np.median(x)
-    return np.median(np.abs(x - m))
+# unchanged files (content, code, parameters) skip detection and figures, None = always run
+CACHE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\outlier_detection\cache"
+CACHE_STAGE = "outlier_detection"
+CODE_VERSION = code_version(__file__)
 
 
+# ---------- Core logic ----------
 def detect_outliers(df: pd.DataFrame, ranges: dict, jump_params: dict) -> pd.DataFrame:
     """Adds *_range_flag, *_jump_flag, and fault_flag columns to df and returns df."""
     df = df.copy()
@@ -40,8 +56,8 @@ def detect_outliers(df: pd.DataFrame, ranges: dict, jump_params: dict) -> pd.Dat
     for col in [c for c in ranges if c in df]:
         p = jump_params
         d = df[col].diff()
-        med = d.rolling(p['win'], center=True, min_periods=max(4, p['win'] // 4)).median()
-        mad = d.rolling(p['win'], center=True, min_periods=max(4, p['win'] // 4)).apply(_rolling_mad, raw=True)
+        # same values as .rolling(...).apply(median absolute deviation, raw=True), without a python call per window
+        mad = pd.Series(rolling_mad(d, p['win'], min_periods=max(4, p['win'] // 4), center=True), index=d.index)
         thresh = p['n_sigmas'] * 1.4826 * mad
 
         large_change = d.abs() > np.maximum(thresh, p['min_abs_jump'])
@@ -63,44 +79,88 @@ def detect_outliers(df: pd.DataFrame, ranges: dict, jump_params: dict) -> pd.Dat
 
 
 def summarize_file(file_path: str) -> tuple[str, int, pd.DataFrame]:
-    df = pd.read_csv(file_path, parse_dates=['datetime'])
-    df = detect_outliers(df, RANGES, JUMP_PARAMS)
+    df = read_clf(file_path)
+    name = parse_clf_name(file_path) or {}
+    ranges = compile_rules(RULES, name.get('logger_type'), name.get('serial'))['ranges']
+    df = detect_outliers(df, ranges, JUMP_PARAMS)
     return os.path.basename(file_path), int(df['fault_flag'].sum()), df
 
 
-def plot_timeseries(df: pd.DataFrame, file_name: str):
-    fig = go.Figure()
-    for col in [c for c in RANGES if c in df]:
-        fig.add_trace(go.Scatter(x=df['datetime'], y=df[col],
-                                 mode='lines', name=col, line=dict(width=2)))
-        # overlay faulty points
+# module level so the figure pool can pickle it, df only needs datetime, the channels and fault_flag
+def plot_timeseries(df: pd.DataFrame, file_name: str, figures_dir: str = FIGURES_DIR,
+                    png: bool = EXPORT_PNG, html: bool = EXPORT_HTML):
+    cols = [c for c in RANGES if c in df]
+    if png:
+        # per-pixel min/max lines with the faulty points on top, rasterized in-process
+        write_png(df, cols, os.path.join(figures_dir, f"{file_name}.png"), markers=df['fault_flag'],
+                  title=f"Time Series: {file_name}", ylabel='Temperature (°C)')
+    if html:
+        fig = go.Figure()
         faulty = df[df['fault_flag']]
-        fig.add_trace(go.Scatter(x=faulty['datetime'], y=faulty[col],
-                                 mode='markers', name=f"{col} fault",
-                                 marker=dict(color='red', size=6)))
-    fig.update_layout(title=f"Time Series: {file_name}",
-                      xaxis_title='Datetime', yaxis_title='Temperature (°C)',
-                      template='plotly_white')
-    fig.write_html(os.path.join(FIGURES_DIR, f"{file_name}.html"))
-    fig.write_image(os.path.join(FIGURES_DIR, f"{file_name}.png"))
+        for col in cols:
+            # decimated line, faulty points are kept exactly
+            fig.add_trace(line_trace(df, col, name=col, keep=df['fault_flag'], line=dict(width=2)))
+            # overlay faulty points
+            fig.add_trace(go.Scatter(x=faulty['datetime'], y=faulty[col],
+                                     mode='markers', name=f"{col} fault",
+                                     marker=dict(color='red', size=6)))
+        fig.update_layout(title=f"Time Series: {file_name}",
+                          xaxis_title='Datetime', yaxis_title='Temperature (°C)',
+                          template='plotly_white')
+        write_figure(fig, os.path.join(figures_dir, f"{file_name}.html"))
 
 
 # ---------- Batch run ----------
-def run_batch(input_glob: str, summary_csv: str):
+# detection runs here file by file, figures are handed to a separate pool and drawn in the background
+# files found in cache_folder get their count and figures back without running detection
+def run_batch(input_glob: str, summary_csv: str, figure_workers=FIGURE_WORKERS, cache_folder=CACHE_FOLDER):
+    os.makedirs(FIGURES_DIR, exist_ok=True)
     files = sorted(glob.glob(input_glob))
+    pool = ProcessPoolExecutor(max_workers=figure_workers) if figure_workers is None or figure_workers > 1 else None
+    pending = []
+    to_cache = []
     rows = []
-    for fp in files:
-        fname, n_out, df = summarize_file(fp)
-        rows.append((fname, n_out))
-        print(f"Processed {fname}: {n_out} outliers")
-        plot_timeseries(df, fname.replace(".csv", ""))
-
-    result = pd.DataFrame(rows, columns=['filename', 'outlier_count'])
-    if os.path.exists(summary_csv):
-        existing = pd.read_csv(summary_csv)
-        out = pd.concat([existing, result], ignore_index=True)
-    else:
-        out = result
+    try:
+        for fp in files:
+            fname = os.path.basename(fp)
+            file_hash = content_hash(fp)
+            name = parse_clf_name(fname) or {}
+            key = stage_key(file_hash, CODE_VERSION, {**OUTLIER_PARAMS, 'file': fname, 'png': EXPORT_PNG, 'html': EXPORT_HTML})
+            hit = restore(cache_folder, CACHE_STAGE, key, {'png': FIGURES_DIR, 'html': FIGURES_DIR}) if cache_folder else None
+            if hit is not None:
+                n_out = hit[0]['outlier_count']
+                print(f"Unchanged {fname}: {n_out} outliers, restored from cache")
+            else:
+                fname, n_out, df = summarize_file(fp)
+                print(f"Processed {fname}: {n_out} outliers")
+                if EXPORT_PNG or EXPORT_HTML:
+                    figure_df = df[['datetime'] + [c for c in RANGES if c in df] + ['fault_flag']]
+                    if pool is not None:
+                        pending.append(pool.submit(plot_timeseries, figure_df, clf_stem(fname)))
+                    else:
+                        plot_timeseries(figure_df, clf_stem(fname))
+                stem = os.path.join(FIGURES_DIR, clf_stem(fname))
+                to_cache.append((key, {'outlier_count': n_out},
+                                 {'png': f"{stem}.png" if EXPORT_PNG else None, 'html': f"{stem}.html" if EXPORT_HTML else None}))
+            rows.append({'content_hash': file_hash, 'filename': fname,
+                         'sensor': name.get('serial'), 'outlier_count': n_out})
+        for future in pending:
+            future.result() # raises figure errors here
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # figures are complete now, cache the new results
+    if cache_folder:
+        for key, stats, outputs in to_cache:
+            try_store(cache_folder, CACHE_STAGE, key, stats, outputs) # a failed cache write only warns
+        evict(cache_folder, CACHE_BUDGET)
+
+    # upsert keyed by file content + parameters, reruns replace their rows instead of appending
+    # the csv is the store's view of this parameter set, rewritten every run
+    upsert(RESULTS_DB, 'outlier_summary', rows, OUTLIER_PARAMS)
+    out = query(RESULTS_DB, 'outlier_summary', params=OUTLIER_PARAMS).sort_values('filename')
+    out = out[['filename', 'sensor', 'outlier_count']].reset_index(drop=True)
     out.to_csv(summary_csv, index=False)
     return out
 
@@ -109,7 +169,6 @@ if __name__ == "__main__":
     run_batch(INPUT_GLOB, SUMMARY_CSV)
 
 
-    # delte summary table if it exists before running
     # delete flagged points from table and export as cleaned df
     # double check thresholds 
     # one of the sensors is effin crooked
@@ -1,39 +1,51 @@
 import os
-import re
+import sys
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, write_clf, clf_name, clf_stem
+from serial_index import find_by_serial
+from clf_figures import line_trace, write_figure, flag_edges, ensure_plotlyjs
+from gap_fill import fill_small_gaps_frame
+from edit_engine import timestamp_intervals, span_interval, apply_interval_edits
+from results_store import content_hash
+from stage_cache import CACHE_BUDGET, code_version, stage_key, try_store, restore, evict
 
 # buncha inputs
 SOURCE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\4_finetuning\source"
 OUT_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\4_finetuning\output"
 FIG_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\4_finetuning\figures"
 ipol_limit = 20 # how many entries can the gap be 
+EXPORT_CSV = False # also write the legacy CLF .csv next to the CLF v2 .parquet
+BATCH = True # True = apply EDIT_LOG to all serials listed there, False = my_edits on the single serial at the bottom
+EDIT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "edit_log.csv") # edits per serial, see BATCH EDITS
+N_WORKERS = os.cpu_count() # number of parallel worker processes in batch mode, 1 = run sequentially without a pool
+CACHE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\4_finetuning\cache" # serials with unchanged edits are restored from here, None = always edit
+CACHE_STAGE = "sledgehammer" # cache sub folder of this script
+CODE_VERSION = code_version(__file__) # this script + the SHARED modules it imports, editing either invalidates the cache
 
 ################################################################################################################
 # DATA HANDLING FUNCTIONS
 ################################################################################################################
-# find file path in source folder by serial number
+# find file path in source folder by serial number, from the folder's serial index (SHARED/serial_index.py)
 def find_file_by_serial(source_folder, serial):
-    pattern = re.compile(rf"CLF_{serial}_.+\.csv$", re.IGNORECASE)
-    for file in os.listdir(source_folder):
-        if pattern.match(file):
-            return os.path.join(source_folder, file)
-    raise FileNotFoundError(f"No {serial} in {source_folder}")
+    return find_by_serial(source_folder, serial)
 
-# loads .csv, checks integrity
+# loads CLF file, checks integrity
 def load_file(path):
-    df = pd.read_csv(path)
-    df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+    df = read_clf(path)
     df = df.sort_values("datetime")
     print(f"Loaded {len(df)} rows from {path}.")
     return df
 
 # export file
 def export_cleaned(df, input_file_name, out_folder):
-    cleaned_name = input_file_name.replace(".csv", "_edited.csv")
+    cleaned_name = clf_name(input_file_name, "_edited")
     out_path = os.path.join(out_folder, cleaned_name)
-    df.to_csv(out_path, index=False)
+    write_clf(df, out_path, export_csv=EXPORT_CSV)
     print(f"Exported cleaned file → {out_path}")
     return out_path
 
@@ -72,13 +84,17 @@ def create_figure(df, cleaned_name, figure_folder):
 
     fig = go.Figure()
 
-    fig.add_trace(go.Scatter(
-        x=df['datetime'], y=df['t3'], mode='lines', name='T air'
-    ))
+    # start and end of flagged spans are always drawn, so edits can be checked to the row
+    keep = np.zeros(len(df), dtype=bool)
+    for flag in ['OOS', 'gap_flag']:
+        if flag in df.columns:
+            keep |= flag_edges(df[flag].fillna(0).to_numpy() == 1)
+
+    fig.add_trace(line_trace(df, 't3', name='T air', keep=keep))
 
     if logger_type == "TMS":
-        fig.add_trace(go.Scatter(x=df['datetime'], y=df['t2'], mode='lines', name='T surface'))
-        fig.add_trace(go.Scatter(x=df['datetime'], y=df['t1'], mode='lines', name='T soil'))
+        fig.add_trace(line_trace(df, 't2', name='T surface', keep=keep))
+        fig.add_trace(line_trace(df, 't1', name='T soil', keep=keep))
 
     fig.update_layout(
         title=f"Edited: {cleaned_name}",
@@ -92,9 +108,9 @@ def create_figure(df, cleaned_name, figure_folder):
 
     fig_path = os.path.join(
         figure_folder,
-        cleaned_name.replace(".csv", "_FIG.html")
+        f"{clf_stem(cleaned_name)}_FIG.html"
     )
-    fig.write_html(fig_path)
+    write_figure(fig, fig_path)
     print(f"Figure saved → {fig_path}")
 
     return fig_path
@@ -104,50 +120,33 @@ def flag_out_of_soil_span(df, start, end):
     Mark a datetime span as out-of-soil (OOS=1).
     Creates column 'OOS' if it does not exist.
     """
-    start = pd.to_datetime(start, utc=True)
-    end   = pd.to_datetime(end,   utc=True)
-
-    # ensure the column exists
-    if "OOS" not in df.columns:
-        df["OOS"] = 0
-
-    mask = (df['datetime'] >= start) & (df['datetime'] <= end)
-    df.loc[mask, "OOS"] = 1
-
-    print(f"Flagged {mask.sum()} rows as Out-of-Soil (OOS=1).")
+    df, counts = apply_interval_edits(df, oos=[span_interval(start, end)])
+    print(f"Flagged {counts['oos_flagged']} rows as Out-of-Soil (OOS=1).")
     return df
 
 
 ####################################################
 # DATA EDITING FUNCTIONS
 ####################################################
+# timestamps and spans are resolved to row ranges by binary search on the sorted datetime column
+# and edited with slices (SHARED/edit_engine.py), no full length mask per timestamp
 def remove_values(df, col, timestamps):
-    ts = pd.to_datetime(timestamps, utc=True)
-    mask = df['datetime'].isin(ts)
-    df.loc[mask, col] = np.nan
-    print(f"Removed {mask.sum()} values from {col}.")
+    df, counts = apply_interval_edits(df, values={col: [timestamp_intervals(timestamps)]})
+    print(f"Removed {counts['values_removed'][col]} values from {col}.")
     return df
 
 def remove_values_span(df, col, start, end, flag_oos=False):
-    start = pd.to_datetime(start, utc=True)
-    end   = pd.to_datetime(end,   utc=True)
-    mask  = (df['datetime'] >= start) & (df['datetime'] <= end)
-
-    # set column values to NaN
-    df.loc[mask, col] = np.nan
-    print(f"Removed {mask.sum()} entries in {col} from {start} to {end}.")
+    span = span_interval(start, end)
+    df, counts = apply_interval_edits(df, values={col: [span]}, oos=[span] if flag_oos else ())
+    print(f"Removed {counts['values_removed'][col]} entries in {col} from {start} to {end}.")
 
     # optionally flag out-of-soil
     if flag_oos:
-        if "OOS" not in df.columns:
-            df["OOS"] = 0
-        df.loc[mask, "OOS"] = 1
-        print(f"Flagged {mask.sum()} rows as Out-of-Soil (OOS=1).")
+        print(f"Flagged {counts['oos_flagged']} rows as Out-of-Soil (OOS=1).")
 
     return df
 
 def remove_rows(df, timestamps=None, start=None, end=None, by_date=False):
-    # this is some vibecoding github copilot shit, i havent checked if it works yet
     """
     Remove rows from df in several flexible ways.
     - timestamps: scalar or list of strings/Timestamps
@@ -158,67 +157,26 @@ def remove_rows(df, timestamps=None, start=None, end=None, by_date=False):
       Strings will be parsed as UTC timestamps (if date-only, they select midnight).
     - by_date: if True, treat date-only inputs as date matches (removes entire day).
     """
-    df = df.copy()
     before = len(df)
-    mask_remove = pd.Series(False, index=df.index)
-
-    # 1) timestamps (scalar -> list)
+    remove = []
     if timestamps is not None:
-        if not isinstance(timestamps, (list, tuple, set, pd.Series)):
-            timestamps = [timestamps]
-
-        for t in timestamps:
-            # parse
-            ts = pd.to_datetime(t, utc=True)
-
-            # If original input was date-only string (no time) AND by_date True,
-            # remove all rows that have the same calendar date in UTC.
-            if by_date and (isinstance(t, str) and re.fullmatch(r"\d{4}-\d{2}-\d{2}$", t)):
-                date_only = ts.date()
-                mask = df['datetime'].dt.date == date_only
-                mask_remove |= mask
-            else:
-                # exact timestamp match (tz-aware)
-                mask = df['datetime'] == ts
-                mask_remove |= mask
-
-    # 2) start/end range removal
+        remove.append(timestamp_intervals(timestamps, by_date=by_date))
     if start is not None or end is not None:
-        if start is not None:
-            start_ts = pd.to_datetime(start, utc=True)
-        else:
-            start_ts = df['datetime'].min()
-        if end is not None:
-            end_ts = pd.to_datetime(end, utc=True)
-        else:
-            end_ts = df['datetime'].max()
-
-        mask_range = (df['datetime'] >= start_ts) & (df['datetime'] <= end_ts)
-        mask_remove |= mask_range
-
-    removed_count = mask_remove.sum()
-    if removed_count > 0:
-        df = df.loc[~mask_remove].copy()
-    else:
+        remove.append(span_interval(start, end))
+    df, counts = apply_interval_edits(df.copy(), remove=remove)
+
+    if counts["rows_removed"] == 0:
         print("No rows matched the removal criteria.")
 
-    print(f"Removed {removed_count} rows (before: {before}, after: {len(df)}).")
+    print(f"Removed {counts['rows_removed']} rows (before: {before}, after: {len(df)}).")
     return df
 
 # interpolate missing data
+# only gaps of at most limit entries are filled, longer gaps stay completely empty (SHARED/gap_fill.py)
 def interpolate_missing(df, limit): 
     #second argument = how many entries large the gap can be 
-    cols = ['t1','t2','t3','SMC']
-    before = df[cols].isna().sum().sum()
-
-    df[cols] = df[cols].interpolate(
-        method='linear',
-        limit=limit,
-        limit_direction='both'
-    )
-
-    after = df[cols].isna().sum().sum()
-    print(f"Filled {before - after} missing values via interpolation.")
+    df, filled, by_length = fill_small_gaps_frame(df, limit)
+    print(f"Filled {filled} missing values via interpolation (by gap length: {by_length}).")
     return df
 
 
@@ -254,13 +212,165 @@ def my_edits(df):
 # remove a range
 #df = remove_rows(df, start="2024-04-24", end="2024-04-26")
 
+##########################################################################################
+# BATCH EDITS FROM THE EDIT LOG
+##########################################################################################
+# edit_log.csv has one row per edit, semicolon separated like SHARED/qa_rules.csv, applied per serial in file order:
+#   remove_rows     start only: that timestamp (date only: the whole day), start + end: the span (both inclusive)
+#   remove_values   the same for the values of column, flag_oos = 1 (start + end only) also flags the span as out of soil (OOS=1)
+#   flag_oos        rows from start to end get OOS=1
+#   interpolate     fill gaps up to limit entries (empty limit = ipol_limit)
+#   detect_gaps     gap_flag column
+# the comment column is free text and not part of the edit
+EDIT_COLUMNS = ["serial", "action", "column", "start", "end", "flag_oos", "limit"]
+EDIT_ACTIONS = ["remove_rows", "remove_values", "flag_oos", "interpolate", "detect_gaps"]
+
+# {serial: [edit, ...]} in file order, checked for unknown actions and missing fields
+def load_edit_log(path=EDIT_LOG):
+    log = pd.read_csv(path, sep=";", dtype=str, keep_default_na=False)
+    missing = [c for c in EDIT_COLUMNS if c not in log.columns]
+    if missing:
+        raise ValueError(f"{path}: missing edit columns {missing}")
+    log = log[EDIT_COLUMNS].apply(lambda col: col.str.strip())
+    problems = {
+        "unknown action": ~log["action"].isin(EDIT_ACTIONS),
+        "no serial": log["serial"] == "",
+        "no start": log["action"].isin(["remove_rows", "remove_values", "flag_oos"]) & (log["start"] == ""),
+        "no end": (log["action"] == "flag_oos") & (log["end"] == ""),
+        "flag_oos without end": (log["action"] == "remove_values") & (log["flag_oos"] == "1") & (log["end"] == ""), # OOS needs a span
+        "flag_oos not 0 or 1": ~log["flag_oos"].isin(["", "0", "1"]),
+        "no column": (log["action"] == "remove_values") & (log["column"] == ""),
+    }
+    for problem, rows in problems.items():
+        if rows.any():
+            raise ValueError(f"{path}: {problem} in rows {(log.index[rows] + 2).tolist()}") # +2 = line in the file
+    return {serial: rows.drop(columns="serial").to_dict("records") for serial, rows in log.groupby("serial", sort=False)}
+
+INTERVAL_ACTIONS = ["remove_rows", "remove_values", "flag_oos"]
+
+# applies the edits of one serial in order. consecutive removals and OOS flags are collected and applied
+# in one pass (SHARED/edit_engine.py), interpolate and detect_gaps run in between with the functions above
+def apply_edits(df, edits):
+    pending = []
+    for edit in edits + [None]:
+        if edit is not None and edit["action"] in INTERVAL_ACTIONS:
+            pending.append(edit)
+            continue
+        if pending:
+            df = apply_interval_batch(df, pending)
+            pending = []
+        if edit is None:
+            break
+        if edit["action"] == "interpolate":
+            df = interpolate_missing(df, int(edit["limit"]) if edit["limit"] else ipol_limit)
+        elif edit["action"] == "detect_gaps":
+            df = detect_gaps(df)
+    return df
+
+# removals, value removals and OOS flags of the edit log as intervals, one apply_interval_edits call
+def apply_interval_batch(df, edits):
+    remove = []
+    values = {}
+    oos = []
+    for edit in edits:
+        action, col, start, end = edit["action"], edit["column"], edit["start"], edit["end"]
+        if action == "remove_rows":
+            remove.append(span_interval(start, end) if end else timestamp_intervals(start, by_date=True))
+        elif action == "remove_values":
+            values.setdefault(col, []).append(span_interval(start, end) if end else timestamp_intervals(start))
+            if end and edit["flag_oos"] == "1":
+                oos.append(span_interval(start, end))
+        elif action == "flag_oos":
+            oos.append(span_interval(start, end))
+    before = len(df)
+    df, counts = apply_interval_edits(df, remove=remove, values=values, oos=oos)
+    for col, n in counts["values_removed"].items():
+        print(f"Removed {n} values from {col}.")
+    if oos:
+        print(f"Flagged {counts['oos_flagged']} rows as Out-of-Soil (OOS=1).")
+    if remove:
+        print(f"Removed {counts['rows_removed']} rows (before: {before}, after: {len(df)}).")
+    return df
+
+# defined on module level so the worker processes can pickle it
+# edits one serial, or restores its outputs if the source file, its edits and the code are unchanged
+# returns a row for the summary, an error does not stop the batch
+def edit_serial(serial, edits, source_folder, output_folder, figure_folder, cache_folder=None):
+    row = {"serial": serial, "file": None, "edits": len(edits), "cached": False, "error": ""}
+    try:
+        source_path = find_file_by_serial(source_folder, serial)
+        row["file"] = os.path.basename(source_path)
+        key = stage_key(content_hash(source_path), CODE_VERSION,
+                        {"serial": serial, "edits": edits, "ipol_limit": ipol_limit, "export_csv": EXPORT_CSV})
+        hit = restore(cache_folder, CACHE_STAGE, key,
+                      {"clf": output_folder, "csv": output_folder, "figure": figure_folder}) if cache_folder else None
+        if hit is not None:
+            ensure_plotlyjs(figure_folder)
+            row["cached"] = True
+            return row
+        df = apply_edits(load_file(source_path), edits)
+        cleaned_path = export_cleaned(df, row["file"], output_folder)
+        fig_path = create_figure(df, os.path.basename(cleaned_path), figure_folder)
+        if cache_folder:
+            try_store(cache_folder, CACHE_STAGE, key, {}, { # a failed cache write only warns
+                "clf": cleaned_path,
+                "csv": f"{clf_stem(cleaned_path)}.csv" if EXPORT_CSV else None,
+                "figure": fig_path,
+            })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+# all serials of the edit log, in parallel if n_workers > 1, only serials whose entries changed are edited again
+def edit_batch(edit_log, source_folder, output_folder, figure_folder, n_workers=1, cache_folder=None,
+               cache_budget=CACHE_BUDGET):
+    edits = load_edit_log(edit_log)
+    serials = list(edits)
+    worker = partial(edit_serial, source_folder=source_folder, output_folder=output_folder,
+                     figure_folder=figure_folder, cache_folder=cache_folder)
+
+    if n_workers is None or n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(worker, serials, edits.values()) # map yields in submission order
+    else:
+        pool = None
+        results = map(worker, serials, edits.values())
+
+    rows = []
+    try:
+        for i, row in enumerate(results, start=1):
+            rows.append(row)
+            if row["error"]:
+                print(f"[{i}/{len(serials)}] FAILED {row['serial']}: {row['error']}")
+            elif row["cached"]:
+                print(f"[{i}/{len(serials)}] Unchanged {row['file']} ({row['edits']} edits), restored from cache")
+            else:
+                print(f"[{i}/{len(serials)}] Edited {row['file']} ({row['edits']} edits)")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if cache_folder:
+        evict(cache_folder, cache_budget) # least recently used entries beyond the disk budget
+
+    failed = sum(1 for row in rows if row["error"])
+    print("\n====================================")
+    print(f" BATCH EDIT COMPLETE, {len(rows) - failed} OF {len(rows)} SERIALS"
+          f" ({sum(row['cached'] for row in rows)} UNCHANGED)")
+    print("====================================")
+    return rows
+
 ### EXECUTE
-edit_file(
-    serial="94290007",
-    source_folder=SOURCE_FOLDER,
-    output_folder=OUT_FOLDER,
-    figure_folder=FIG_FOLDER,
-    edits_fn=my_edits
-)
+# guard is required for the process pool (workers re-import this script on windows)
+if __name__ == "__main__":
+    if BATCH:
+        edit_batch(EDIT_LOG, SOURCE_FOLDER, OUT_FOLDER, FIG_FOLDER, n_workers=N_WORKERS, cache_folder=CACHE_FOLDER)
+    else:
+        edit_file(
+            serial="94290007",
+            source_folder=SOURCE_FOLDER,
+            output_folder=OUT_FOLDER,
+            figure_folder=FIG_FOLDER,
+            edits_fn=my_edits
+        )
 
 
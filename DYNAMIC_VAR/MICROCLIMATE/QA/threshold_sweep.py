@@ -0,0 +1,152 @@
+# PURPOSE: SWEEPS RANGE AND JUMP THRESHOLDS OVER ALL SENSORS IN ONE RUN, TO PICK QA SETTINGS WITHOUT RERUNNING big_QA
+# every sensor is put on the QA grid once (same rows big_QA checks), then every channel is evaluated for all
+# combinations of its candidate ranges and jumps at once (SHARED/qa_kernel.py sweep_range_and_jump)
+# the counts are exactly what big_QA would report as insane_values_removed / jump_values_removed for that setting
+#
+# outputs in REP_FOLDER:
+#   QA_sweep_<time>.csv           one row per sensor, channel and (range, jump) combination
+#   QA_sweep_settings_<time>.csv  one row per combination of all channels, summed over sensors, fewest removed first
+# channels are checked independently, so the count of a setting is the sum of its channel rows
+
+import os
+import sys
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SHARED")) # shared CLF modules
+from clf_io import read_clf, list_clf_files, parse_clf_name
+from qa_kernel import qa_grid, sweep_range_and_jump
+
+###################################
+# FILEPATHS & SETTINGS
+###################################
+SOURCE_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\3_QA\source"
+REP_FOLDER = r"\\ad.helsinki.fi\home\t\terschan\Desktop\paper1\data\11.25\processed\3_QA\reports"
+N_WORKERS = os.cpu_count() # number of parallel worker processes, 1 = run sequentially without a pool
+
+# candidate thresholds per channel, every range is combined with every jump
+# includes the big_QA (2/3/2) and big_QA_alt (3/4/4) jumps
+SWEEP_RANGES = {
+    't1': [(-20, 30), (-15, 25), (-25, 35)],   # soil
+    't2': [(-35, 45), (-30, 40), (-40, 50)],   # surface
+    't3': [(-35, 40), (-30, 35), (-40, 45)],   # air
+}
+SWEEP_JUMPS = {
+    't1': [1, 1.5, 2, 3, 4, 5],
+    't2': [2, 3, 4, 5, 6],
+    't3': [1.5, 2, 3, 4, 5],
+}
+
+SWEEP_COLUMNS = ["file", "sensor", "channel", "valid_min", "valid_max", "max_jump",
+                 "insane_values_removed", "jump_values_removed", "removed", "error"]
+
+###################################
+# SWEEP OF A SINGLE FILE
+###################################
+# defined on module level so the worker processes can pickle it
+# returns the sweep rows of the file, a file that fails gets one row with its error
+def sweep_file(file, source_folder, sweep_ranges=SWEEP_RANGES, sweep_jumps=SWEEP_JUMPS):
+    try:
+        df = read_clf(os.path.join(source_folder, file))
+        column = qa_grid(df, list(sweep_ranges))
+    except Exception as e:
+        return [{"file": file, "error": f"{type(e).__name__}: {e}"}]
+
+    name = parse_clf_name(file)
+    rows = []
+    for col, ranges in sweep_ranges.items():
+        jumps = sweep_jumps[col]
+        insane, jump = sweep_range_and_jump(column[col], ranges, jumps)
+        for r, (valid_min, valid_max) in enumerate(ranges):
+            for j, max_jump in enumerate(jumps):
+                rows.append({
+                    "file": file,
+                    "sensor": None if name is None else name["serial"],
+                    "channel": col,
+                    "valid_min": valid_min,
+                    "valid_max": valid_max,
+                    "max_jump": max_jump,
+                    "insane_values_removed": int(insane[r]),
+                    "jump_values_removed": int(jump[r, j]),
+                    "removed": int(insane[r] + jump[r, j]),
+                    "error": "",
+                })
+    return rows
+
+###################################
+# SETTINGS TABLE
+###################################
+# every combination of the channel thresholds with its counts summed over all sensors
+def combine_channels(sweep):
+    totals = (sweep[sweep["error"] == ""]
+              .groupby(["channel", "valid_min", "valid_max", "max_jump"], sort=False)
+              [["insane_values_removed", "jump_values_removed", "removed"]].sum()
+              .reset_index())
+    per_channel = []
+    for col, rows in totals.groupby("channel", sort=False):
+        rows = rows.drop(columns="channel")
+        per_channel.append(rows.rename(columns={c: f"{col}_{c}" for c in rows.columns}))
+    if not per_channel:
+        return pd.DataFrame()
+    settings = per_channel[0]
+    for rows in per_channel[1:]:
+        settings = settings.merge(rows, how="cross")
+    for count in ["insane_values_removed", "jump_values_removed", "removed"]:
+        settings[count] = settings[[c for c in settings.columns if c.endswith(f"_{count}")]].sum(axis=1)
+    return settings.sort_values("removed", kind="stable").reset_index(drop=True)
+
+###################################
+# SWEEP LOOP
+###################################
+# files are swept in parallel if n_workers > 1, rows come back in file order
+def sweep_folder(source_folder, report_folder, n_workers=1):
+    files = list_clf_files(source_folder)
+    n_settings = 1
+    for col in SWEEP_RANGES:
+        n_settings *= len(SWEEP_RANGES[col]) * len(SWEEP_JUMPS[col])
+    worker = partial(sweep_file, source_folder=source_folder)
+
+    if n_workers is None or n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(worker, files) # map yields in submission order
+    else:
+        pool = None
+        results = map(worker, files)
+
+    rows = []
+    try:
+        for i, file_rows in enumerate(results, start=1):
+            rows.extend(file_rows)
+            if file_rows[0]["error"]:
+                print(f"[{i}/{len(files)}] FAILED {files[i - 1]}: {file_rows[0]['error']}")
+            else:
+                print(f"[{i}/{len(files)}] Swept {files[i - 1]}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sweep = pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+    counts = ["insane_values_removed", "jump_values_removed", "removed"]
+    sweep[counts] = sweep[counts].astype("Int64") # stay integers next to failed rows
+    sweep_path = os.path.join(report_folder, f"QA_sweep_{timestamp}.csv")
+    sweep.to_csv(sweep_path, index=False)
+
+    settings = combine_channels(sweep)
+    settings_path = os.path.join(report_folder, f"QA_sweep_settings_{timestamp}.csv")
+    settings.to_csv(settings_path, index=False)
+
+    print("\n====================================")
+    print(f" SWEEP COMPLETE, {n_settings} SETTINGS OVER {len(files)} FILES")
+    print(f" {sweep_path}")
+    print(f" {settings_path}")
+    print("====================================")
+    return sweep, settings
+
+###################################
+# RUN
+###################################
+# guard is required for the process pool (workers re-import this script on windows)
+if __name__ == "__main__":
+    sweep_folder(SOURCE_FOLDER, REP_FOLDER, n_workers=N_WORKERS)
@@ -0,0 +1,197 @@
+# PURPOSE: SHARED PLOTLY FIGURE HELPERS, DECIMATED LINE TRACES AND ONE SHARED PLOTLY.JS PER FIGURE FOLDER
+#
+# a year of 15 min data is ~35000 points per trace, far more than the ~1200 px a figure is wide
+# line_trace draws a shape preserving subset of the points instead:
+#   minmax  first/last, minimum and maximum of every pixel bucket, peaks and spikes are never lost (default)
+#   lttb    largest-triangle-three-buckets, smoother look for the same number of points
+# gaps (NaN runs) stay visible as breaks and points passed as keep (flags, outliers) are always drawn exactly
+# write_figure references a plotly.min.js next to the html instead of inlining ~4 MB into every file
+# write_png renders static overviews with matplotlib's Agg rasterizer in-process, no image export server
+
+import os
+import numpy as np
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs
+
+#####################
+# SETTINGS          #
+#####################
+FIGURE_POINTS = 2400 # points per trace, about 2 per pixel of a 1200 px wide figure, None = no decimation
+FIGURE_METHOD = "minmax" # minmax or lttb
+PLOTLYJS_NAME = "plotly.min.js" # plotly looks for this name when include_plotlyjs="directory"
+PNG_SIZE = (1200, 500) # static figure size in pixels
+PNG_DPI = 100
+
+#####################
+# DECIMATION        #
+#####################
+# indices of the minimum and maximum of each of n_buckets position buckets, plus the first and last point
+def minmax_indices(y, n_buckets):
+    n = len(y)
+    size = int(np.ceil(n / n_buckets))
+    n_buckets = int(np.ceil(n / size))
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    valid = ~np.isnan(padded)
+    offsets = np.arange(n_buckets) * size
+    lo = np.where(valid, padded, np.inf).argmin(axis=1) + offsets
+    hi = np.where(valid, padded, -np.inf).argmax(axis=1) + offsets
+    has_data = valid.any(axis=1)
+    return np.unique(np.concatenate([lo[has_data], hi[has_data], [0, n - 1]]))
+
+# largest-triangle-three-buckets over the valid points, x as float (e.g. seconds)
+def lttb_indices(x, y, n_out):
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n <= n_out or n_out < 3:
+        return valid
+    xv = x[valid]
+    yv = y[valid]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int) # n_out - 2 buckets between first and last point
+    chosen = np.empty(n_out, dtype=int)
+    chosen[0] = 0
+    chosen[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges): # average of the next bucket is the third triangle corner
+            x_next = xv[hi:edges[i + 2]].mean()
+            y_next = yv[hi:edges[i + 2]].mean()
+        else:
+            x_next, y_next = xv[-1], yv[-1]
+        area = np.abs((xv[a] - x_next) * (yv[lo:hi] - yv[a]) - (xv[a] - xv[lo:hi]) * (y_next - yv[a]))
+        a = lo + int(area.argmax())
+        chosen[i + 1] = a
+    return valid[chosen]
+
+# first index of every NaN run, keeps gaps as line breaks after decimation
+def gap_indices(y):
+    missing = np.isnan(y)
+    return np.flatnonzero(missing & ~np.concatenate([[False], missing[:-1]]))
+
+# positions of the points to draw, sorted
+def decimate(x, y, n_out=FIGURE_POINTS, method=FIGURE_METHOD, keep=None):
+    y = np.asarray(y, dtype=float)
+    if n_out is None or len(y) <= n_out:
+        return np.arange(len(y))
+    if method == "lttb":
+        picked = lttb_indices(np.asarray(x, dtype=float), y, n_out)
+    elif method == "minmax":
+        picked = minmax_indices(y, max(n_out // 2, 1))
+    else:
+        raise ValueError(f"Unknown decimation method: {method}")
+    parts = [picked, gap_indices(y)]
+    if keep is not None:
+        parts.append(np.flatnonzero(np.asarray(keep, dtype=bool)))
+    return np.unique(np.concatenate(parts))
+
+# start and end rows of every flagged span, for flags that cover long periods (OOS, gap_flag)
+def flag_edges(flag):
+    flag = np.asarray(flag, dtype=bool)
+    before = np.concatenate([[False], flag[:-1]])
+    after = np.concatenate([flag[1:], [False]])
+    return flag & ~(before & after)
+
+#####################
+# TRACES            #
+#####################
+# decimated go.Scatter line of df[col] against df[x_col], extra kwargs go to go.Scatter
+def line_trace(df, col, name=None, keep=None, x_col='datetime', n_out=FIGURE_POINTS, method=FIGURE_METHOD, **kwargs):
+    x = df[x_col]
+    y = df[col].to_numpy(dtype=float)
+    x_num = (x - x.iloc[0]).dt.total_seconds().to_numpy() if len(x) and hasattr(x, 'dt') else x.to_numpy(dtype=float)
+    idx = decimate(x_num, y, n_out=n_out, method=method, keep=keep)
+    kwargs.setdefault('mode', 'lines')
+    return go.Scatter(x=x.iloc[idx], y=y[idx], name=name or col, **kwargs)
+
+#####################
+# EXPORT            #
+#####################
+# writes plotly.min.js once per folder, through a temp file so parallel workers never see a half written asset
+def ensure_plotlyjs(folder):
+    path = os.path.join(folder, PLOTLYJS_NAME)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp_path, path)
+    return path
+
+# html figure that loads the shared plotly.min.js from its own folder
+def write_figure(fig, figure_path):
+    ensure_plotlyjs(os.path.dirname(os.path.abspath(figure_path)))
+    fig.write_html(figure_path, include_plotlyjs="directory")
+    return figure_path
+
+#####################
+# CLF FIGURE        #
+#####################
+# overview figure of a freshly converted CLF file, shared by the converters
+def create_clf_figure(df, logger_type, filename, figure_path):
+    fig = go.Figure()
+    fig.add_trace(line_trace(df, 't3', name='T air'))
+    if logger_type == 'TMS':  # Add more traces for TMS
+        fig.add_trace(line_trace(df, 't2', name='T surface'))
+        fig.add_trace(line_trace(df, 't1', name='T soil'))
+    fig.update_layout(
+        shapes=[dict(
+            type="rect",
+            xref="x", yref="paper",
+            x0="2024-05-15", x1="2024-09-15",
+            y0=0, y1=1,
+            fillcolor="yellow", opacity=0.2, line_width=0,
+        )],
+        annotations=[dict(
+            x='2024-07-15',
+            y=1.05,
+            xref='x',
+            yref='paper',
+            text='Summer 24',
+            showarrow=False,
+            font=dict(size=14, color="yellow"),
+            align="center"
+        )],
+        title=f"{'Soil, surface, air temperature' if logger_type == 'TMS' else 'Air temperature'}, {filename}",
+        xaxis_title='Date',
+        yaxis_title='Temperature (°C)',
+        hovermode='x unified',
+        template='plotly_dark',
+        height=700,
+        width=1200
+    )
+    return write_figure(fig, figure_path)
+
+#####################
+# STATIC FIGURES    #
+#####################
+# png of df[cols] against df[x_col], markers (bool per row) are drawn as red points on every line
+# each line is first reduced to the minimum and maximum of every pixel column (minmax decimation),
+# so the rasterizer only draws ~2 points per pixel no matter how long the series is
+# matplotlib is only needed here, it is imported on first use so the converters do not depend on it
+def write_png(df, cols, png_path, markers=None, title="", ylabel="", x_col='datetime', size=PNG_SIZE, dpi=PNG_DPI):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    x = df[x_col]
+    x_num = (x - x.iloc[0]).dt.total_seconds().to_numpy() if len(x) else np.zeros(0)
+    x_plot = x.dt.tz_localize(None).to_numpy() if getattr(x.dt, "tz", None) is not None else x.to_numpy()
+    markers = None if markers is None else np.asarray(markers, dtype=bool)
+
+    fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for col in cols:
+        y = df[col].to_numpy(dtype=float)
+        idx = decimate(x_num, y, n_out=2 * size[0], method="minmax")
+        ax.plot(x_plot[idx], y[idx], linewidth=0.8, label=col)
+    if markers is not None and markers.any():
+        for col in cols:
+            ax.scatter(x_plot[markers], df[col].to_numpy(dtype=float)[markers], s=9, color="red", zorder=3)
+    ax.set_title(title)
+    ax.set_xlabel(x_col)
+    ax.set_ylabel(ylabel)
+    ax.legend(loc="upper right")
+    fig.tight_layout()
+    fig.savefig(png_path)
+    return png_path
@@ -0,0 +1,173 @@
+# PURPOSE: READS AND WRITES CLF FILES, SHARED BY ALL CLF CONVERSION AND QA STAGES
+#
+# CLF v2 is a typed columnar (parquet) version of the common logger format:
+#   datetime             timestamp[ns, UTC], stored as int64 nanoseconds since epoch
+#   t1, t2, t3, SMC      float32
+#   OOS, gap_flag        int8
+#   *_flag (bool)        bool
+# stages hand parquet files to each other, CSV is only written on request for people/tools that want text
+# legacy CLF .csv files are still read so old outputs can enter the pipeline at any stage
+
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+#####################
+# FORMAT SETTINGS   #
+#####################
+CLF_VERSION = "2"
+CLF_EXT = ".parquet"
+CSV_EXT = ".csv"
+CLF_COLUMNS = ['datetime', 't1', 't2', 't3', 'SMC']
+VALUE_COLUMNS = ['t1', 't2', 't3', 'SMC']
+INT_FLAG_COLUMNS = ['OOS', 'gap_flag']
+DECIMALS = 4 # decimals of the value columns in the csv export, float32 values widened to float64 print ~15 digits otherwise
+
+#####################
+# FILE NAMES        #
+#####################
+# true for CLF v2 and legacy CLF csv files
+def is_clf_file(filename):
+    return filename.lower().endswith((CLF_EXT, CSV_EXT))
+
+# strips the CLF extension, e.g. CLF_94290007_2024_11_05_TMS.parquet -> CLF_94290007_2024_11_05_TMS
+def clf_stem(filename):
+    for ext in (CLF_EXT, CSV_EXT):
+        if filename.lower().endswith(ext):
+            return filename[:-len(ext)]
+    return filename
+
+# builds the output name of a stage, e.g. clf_name("CLF_x_TMS.csv", "_QA") -> CLF_x_TMS_QA.parquet
+def clf_name(filename, suffix=""):
+    return f"{clf_stem(filename)}{suffix}{CLF_EXT}"
+
+# serial, download date and logger type from a CLF file name of any stage
+# CLF_94290007_2024_11_05_TMS_filtered_QA.parquet -> {'serial': '94290007', 'date': '2024_11_05', 'logger_type': 'TMS'}
+# CLF_SurveyTag_1001_ST.parquet -> {'serial': 'SurveyTag_1001', 'date': None, 'logger_type': 'ST'}
+CLF_NAME = re.compile(r"^CLF_(?P<serial>.+?)_(?:(?P<date>\d{4}_\d{2}_\d{2})_)?(?P<logger_type>TMS|TL|ST)(?:_|$)")
+def parse_clf_name(filename):
+    match = CLF_NAME.match(clf_stem(os.path.basename(filename)))
+    if match is None:
+        return None
+    return match.groupdict()
+
+#####################
+# WRITE             #
+#####################
+# casts a CLF dataframe to the v2 column types
+def _to_v2(df):
+    df = df.copy()
+    df.attrs = {} # in-memory metadata is not part of the file
+    df['datetime'] = pd.to_datetime(df['datetime'], utc=True).astype("datetime64[ns, UTC]")
+    for col in df.columns:
+        if col in VALUE_COLUMNS:
+            df[col] = df[col].astype(np.float32)
+        elif col in INT_FLAG_COLUMNS:
+            df[col] = df[col].fillna(0).astype(np.int8)
+    return df
+
+# writes df as CLF v2 to path (extension is replaced by .parquet), optionally also as legacy csv
+# returns the path of the parquet file
+def write_clf(df, path, export_csv=False):
+    path = clf_stem(path) + CLF_EXT
+    table = pa.Table.from_pandas(_to_v2(df), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"clf_version"] = CLF_VERSION.encode()
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    if export_csv:
+        df.round(dict.fromkeys(VALUE_COLUMNS, DECIMALS)).to_csv(clf_stem(path) + CSV_EXT, index=False)
+    return path
+
+#####################
+# READ              #
+#####################
+# reads a CLF v2 parquet or legacy csv file
+# datetime comes back tz-aware UTC and values as float64 so the QA math is unchanged
+def read_clf(path, columns=None):
+    if path.lower().endswith(CSV_EXT):
+        df = pd.read_csv(path, usecols=columns)
+        df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+        return df
+    return _from_v2(pq.read_table(path, columns=columns).to_pandas())
+
+# tz-aware UTC datetime and float64 values for the QA math
+def _from_v2(df):
+    if 'datetime' in df.columns:
+        df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+    for col in VALUE_COLUMNS:
+        if col in df.columns and df[col].dtype == np.float32:
+            df[col] = df[col].astype(np.float64)
+    return df
+
+# lists CLF files in a folder, optionally only those whose name contains one of the given keys
+# if a file exists as parquet and as exported csv only the parquet is listed
+def list_clf_files(folder, contains=None):
+    files = {}
+    for filename in sorted(os.listdir(folder)):
+        if not is_clf_file(filename):
+            continue
+        if contains is not None and not any(key in filename.upper() for key in contains):
+            continue
+        stem = clf_stem(filename)
+        if stem not in files or filename.lower().endswith(CLF_EXT):
+            files[stem] = filename
+    return sorted(files.values())
+
+#####################
+# NETWORK DATASET   #
+#####################
+# all sensors in one hive partitioned parquet dataset: <root>/sensor_id=<serial>/month=<YYYY-MM>/part-0.parquet
+# rows are sorted by datetime so the min/max statistics of each row group are tight
+# readers filter on sensor and month by directory and on datetime by row group statistics
+DATASET_PARTITIONING = ds.partitioning(pa.schema([("sensor_id", pa.string()), ("month", pa.string())]), flavor="hive")
+MAX_ROWS_PER_GROUP = 4096 # about 6 weeks of 15 min data
+
+# replaces all partitions of one sensor with df (a CLF table)
+def write_dataset(df, root, sensor_id, logger_type=None, max_rows_per_group=MAX_ROWS_PER_GROUP):
+    sensor_dir = os.path.join(root, f"sensor_id={sensor_id}")
+    if os.path.isdir(sensor_dir): # months that vanished from the sensor must not linger
+        shutil.rmtree(sensor_dir)
+    df = _to_v2(df).sort_values('datetime')
+    df['logger_type'] = logger_type
+    df['sensor_id'] = str(sensor_id)
+    df['month'] = df['datetime'].dt.strftime("%Y-%m")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table, root,
+        format="parquet",
+        partitioning=DATASET_PARTITIONING,
+        basename_template="part-{i}.parquet",
+        max_rows_per_group=max_rows_per_group,
+        min_rows_per_group=min(max_rows_per_group, 1024),
+        existing_data_behavior="delete_matching",
+    )
+    return sensor_dir
+
+def _utc(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+# reads a slice of the network dataset, filters are pushed down to partitions and row groups
+# sensors: list of serials, start/end: anything pd.Timestamp understands (naive = UTC), end is inclusive
+def read_dataset(root, sensors=None, start=None, end=None, columns=None):
+    dataset = ds.dataset(root, format="parquet", partitioning=DATASET_PARTITIONING)
+    filters = []
+    if sensors is not None:
+        filters.append(ds.field("sensor_id").isin([str(s) for s in sensors]))
+    if start is not None:
+        start = _utc(start)
+        filters.append(ds.field("month") >= start.strftime("%Y-%m"))
+        filters.append(ds.field("datetime") >= pa.scalar(start, type=pa.timestamp("ns", tz="UTC")))
+    if end is not None:
+        end = _utc(end)
+        filters.append(ds.field("month") <= end.strftime("%Y-%m"))
+        filters.append(ds.field("datetime") <= pa.scalar(end, type=pa.timestamp("ns", tz="UTC")))
+    expr = None
+    for f in filters:
+        expr = f if expr is None else expr & f
+    return _from_v2(dataset.to_table(columns=columns, filter=expr).to_pandas())
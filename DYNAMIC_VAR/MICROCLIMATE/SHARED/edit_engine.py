@@ -0,0 +1,112 @@
+# PURPOSE: INTERVAL EDITS OF A CLF FRAME (REMOVE ROWS, NaN VALUES, FLAG OOS) RESOLVED BY BINARY SEARCH, USED BY sledgehammer
+#
+# every edit is an inclusive interval [start, end] of int64 nanoseconds (UTC):
+#   exact timestamp   [t, t]
+#   date (by_date)    [00:00, 24:00) of that day
+#   span              [start, end], a missing start/end is open
+# all intervals of a frame are resolved against the sorted datetime column with np.searchsorted into row ranges
+# [lo, hi), overlapping ranges are merged, and each target (row removal, a column, OOS) is edited with slices,
+# so the cost grows with the number of edits instead of edits x rows
+
+import re
+import numpy as np
+import pandas as pd
+
+DATE_ONLY = re.compile(r"\d{4}-\d{2}-\d{2}")
+NS_PER_DAY = 86400 * 10**9
+OPEN_START = np.iinfo(np.int64).min
+OPEN_END = np.iinfo(np.int64).max
+
+#####################
+# INTERVALS         #
+#####################
+# strings / Timestamps -> int64 ns since epoch, naive values are read as UTC
+# parsed one by one, edit lists mix dates and timestamps and are short
+def utc_ns(values):
+    return np.array([pd.to_datetime(v, utc=True).value for v in values], dtype=np.int64)
+
+# one interval per timestamp (scalar or list), with by_date a date only string covers that whole day (UTC)
+def timestamp_intervals(timestamps, by_date=False):
+    if not isinstance(timestamps, (list, tuple, set, pd.Series, np.ndarray)):
+        timestamps = [timestamps]
+    timestamps = list(timestamps)
+    start = utc_ns(timestamps)
+    whole_day = np.array([by_date and isinstance(t, str) and DATE_ONLY.fullmatch(t.strip()) is not None
+                          for t in timestamps], dtype=bool)
+    return np.column_stack([start, np.where(whole_day, start + NS_PER_DAY - 1, start)]).reshape(-1, 2)
+
+# the interval start <= datetime <= end, None = open
+def span_interval(start=None, end=None):
+    lo = OPEN_START if start is None else utc_ns([start])[0]
+    hi = OPEN_END if end is None else utc_ns([end])[0]
+    return np.array([[lo, hi]], dtype=np.int64)
+
+#####################
+# RESOLVE           #
+#####################
+# row ranges [lo, hi) of the intervals in the sorted stamps ns
+def resolve(ns, intervals):
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+    return np.searchsorted(ns, intervals[:, 0], side="left"), np.searchsorted(ns, intervals[:, 1], side="right")
+
+# sorted, non-overlapping, non-empty row ranges covering the same rows
+def merge_ranges(lo, hi):
+    keep = hi > lo
+    lo, hi = lo[keep], hi[keep]
+    if len(lo) == 0:
+        return lo, hi
+    order = np.argsort(lo, kind="stable")
+    lo, hi = lo[order], hi[order]
+    reach = np.maximum.accumulate(hi)
+    new = np.r_[True, lo[1:] > reach[:-1]] # a range that starts after everything before it ends
+    first = np.flatnonzero(new)
+    return lo[first], np.maximum.reduceat(hi, first)
+
+def _ranges(ns, parts):
+    parts = [np.asarray(p, dtype=np.int64).reshape(-1, 2) for p in parts]
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return merge_ranges(*resolve(ns, np.concatenate(parts)))
+
+#####################
+# APPLY             #
+#####################
+# applies all interval edits of a frame in one pass, each argument is a list of interval arrays:
+#   remove   rows to drop
+#   values   {column: [...]}, values set to NaN
+#   oos      rows flagged OOS=1 (column created with 0 if missing)
+# values and flags are set before rows are dropped, the result is the same in any order of the edits
+# returns (df, {"rows_removed": n, "values_removed": {column: n}, "oos_flagged": n}), counts are matched rows
+def apply_interval_edits(df, remove=(), values=None, oos=()):
+    if not df['datetime'].is_monotonic_increasing:
+        df = df.sort_values('datetime', kind="stable")
+    stamps = pd.to_datetime(df['datetime'], utc=True, cache=False) # no cache, it iterates the values
+    ns = stamps.dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    counts = {"rows_removed": 0, "values_removed": {}, "oos_flagged": 0}
+
+    for col, parts in (values or {}).items():
+        lo, hi = _ranges(ns, parts)
+        counts["values_removed"][col] = int((hi - lo).sum())
+        if len(lo):
+            x = df[col].to_numpy(dtype=float, copy=True)
+            for a, b in zip(lo, hi):
+                x[a:b] = np.nan
+            df[col] = x
+
+    if len(oos):
+        lo, hi = _ranges(ns, oos)
+        counts["oos_flagged"] = int((hi - lo).sum())
+        flag = df["OOS"].fillna(0).to_numpy(dtype=np.int64, copy=True) if "OOS" in df.columns else np.zeros(len(df), dtype=np.int64)
+        for a, b in zip(lo, hi):
+            flag[a:b] = 1
+        df["OOS"] = flag
+
+    if len(remove):
+        lo, hi = _ranges(ns, remove)
+        counts["rows_removed"] = int((hi - lo).sum())
+        if len(lo):
+            keep = np.ones(len(df), dtype=bool)
+            for a, b in zip(lo, hi):
+                keep[a:b] = False
+            df = df.loc[keep].copy()
+    return df, counts
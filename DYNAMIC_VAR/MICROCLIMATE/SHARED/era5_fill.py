@@ -0,0 +1,111 @@
+# PURPOSE: FILLS LONG t3 GAPS FROM ERA5 PREDICTORS, ONE LINEAR MODEL PER SENSOR, GAP AND HOUR OF DAY
+#
+# small gaps are interpolated in QA (SHARED/gap_fill.py), longer ones stay NaN. here every longer gap gets
+#   t3 = a + b * t2m + c * ssrd
+# fitted separately for each hour of the day on the valid rows within window rows before and after the gap,
+# so the model follows the sensor's own offset to ERA5 (shade, canopy, ...) at that time of year and day
+#
+# all sensors of a batch share one (time x sensor) grid. the normal equations of every window come from running
+# sums: the rows are ordered by hour of day, the products of the design terms are summed cumulatively once, and
+# the sums of a window and hour are the difference of two cumulative rows found by binary search.
+# all (gap x hour) systems are then solved in one stacked pseudo-inverse, there is no loop over gaps
+#
+# ERA5 arrives hourly, era_to_grid() interpolates it linearly onto the 15 min grid
+
+import numpy as np
+from gap_fill import nan_runs
+
+NS_PER_HOUR = 3600 * 10**9
+HOURS = 24
+
+#####################
+# PREDICTORS        #
+#####################
+# hourly ERA5 values (era time x sensor) linearly onto the grid stamps, NaN outside the ERA5 period
+def era_to_grid(era_ns, era_values, grid_ns):
+    k = np.searchsorted(era_ns, grid_ns, side="right") - 1
+    inside = (k >= 0) & (grid_ns <= era_ns[-1])
+    k = np.clip(k, 0, len(era_ns) - 2)
+    w = ((grid_ns - era_ns[k]) / (era_ns[k + 1] - era_ns[k]))[:, None]
+    out = (1 - w) * era_values[k] + w * era_values[k + 1]
+    out[~inside] = np.nan
+    return out
+
+#####################
+# GAPS              #
+#####################
+# interior NaN runs of y (time x sensor) with min_length < length <= max_length, as (row, length, sensor)
+# runs at the start or end of a sensor's span are left alone, there is data on one side only
+def long_gaps(y, cover, min_length, max_length):
+    n = y.shape[0]
+    start, length, sensor = nan_runs(y, cover)
+    row = start - sensor * n
+    end = row + length
+    interior = (row > 0) & (end < n)
+    interior[interior] = cover[row[interior] - 1, sensor[interior]] & cover[end[interior], sensor[interior]]
+    keep = interior & (length > min_length) & (length <= max_length)
+    return row[keep], length[keep], sensor[keep]
+
+#####################
+# FIT AND FILL      #
+#####################
+# y: t3 (time x sensor), X: predictors (time x sensor x predictor), hour: hour of day of every grid row
+# cover: rows each sensor spans. fills the long gaps of y in place and returns
+# (filled rows mask, per sensor (gaps, gaps filled, values filled))
+# a gap hour with fewer than min_points valid rows in its window stays NaN
+def fill_long_gaps(y, X, hour, cover, min_length, max_length, window, min_points):
+    n, n_sensors = y.shape
+    row, length, sensor = long_gaps(y, cover, min_length, max_length)
+    filled = np.zeros(y.shape, dtype=bool)
+    stats = np.zeros((n_sensors, 3), dtype=np.int64)
+    np.add.at(stats[:, 0], sensor, 1)
+    if len(row) == 0:
+        return filled, stats
+
+    # design terms [1, predictors], zero on rows that cannot be used for fitting
+    Z = np.concatenate([np.ones((n, n_sensors, 1)), X], axis=2)
+    valid = cover & ~np.isnan(y) & ~np.isnan(X).any(axis=2)
+    order = np.argsort(hour, kind="stable") # rows by hour of day, in time order within an hour
+    Zv = np.where(valid[order, :, None], Z[order], 0.0)
+    yv = np.where(valid[order], y[order], 0.0)
+
+    # cumulative normal equation terms, row 0 is the empty sum
+    p = Z.shape[2]
+    ZtZ = np.zeros((n + 1, n_sensors, p, p))
+    np.cumsum(Zv[:, :, :, None] * Zv[:, :, None, :], axis=0, out=ZtZ[1:])
+    Zty = np.zeros((n + 1, n_sensors, p))
+    np.cumsum(Zv * yv[:, :, None], axis=0, out=Zty[1:])
+    count = np.zeros((n + 1, n_sensors))
+    np.cumsum(valid[order], axis=0, out=count[1:])
+    del Zv, yv
+
+    # window of every gap, as positions in the hour ordered rows for all 24 hours
+    keys = hour[order].astype(np.int64) * n + order
+    lo = np.maximum(row - window, 0)
+    hi = np.minimum(row + length + window, n)
+    hours = np.arange(HOURS)
+    pos_lo = np.searchsorted(keys, hours * n + lo[:, None]) # (gaps x hours)
+    pos_hi = np.searchsorted(keys, hours * n + hi[:, None])
+    s = sensor[:, None]
+    A = ZtZ[pos_hi, s] - ZtZ[pos_lo, s]
+    b = Zty[pos_hi, s] - Zty[pos_lo, s]
+    enough = (count[pos_hi, s] - count[pos_lo, s]) >= min_points
+
+    # one stacked solve for all (gap x hour) systems
+    coef = np.full(b.shape, np.nan)
+    coef[enough] = (np.linalg.pinv(A[enough]) @ b[enough][:, :, None])[:, :, 0]
+
+    # predictions for every gap row
+    gap = np.repeat(np.arange(len(row)), length)
+    at = np.repeat(row - np.cumsum(np.r_[0, length[:-1]]), length) + np.arange(length.sum())
+    col = sensor[gap]
+    pred = np.einsum("ij,ij->i", coef[gap, hour[at]], Z[at, col])
+    ok = np.isfinite(pred)
+    y[at[ok], col[ok]] = pred[ok]
+    filled[at[ok], col[ok]] = True
+
+    gap_filled = np.zeros(len(row), dtype=bool)
+    gap_filled[gap[ok]] = True
+    np.add.at(stats[:, 1], sensor, gap_filled)
+    np.add.at(stats[:, 2], col[ok], 1)
+    return filled, stats
@@ -0,0 +1,78 @@
+# PURPOSE: ON-DISK MANIFEST OF CONVERTED FILES, LETS THE CLF CONVERTERS SKIP UNCHANGED INPUTS
+#
+# one row per raw input file: content hash, size, mtime, the converter settings and the outputs it produced
+# a file is reconverted only if it is new, its content changed, the settings changed or an output went missing
+# size + mtime are checked first, the file is only hashed when they differ from the manifest
+
+import os
+import json
+import hashlib
+import pandas as pd
+
+MANIFEST_NAME = "conversion_manifest.csv" # converters sharing an output folder pass their own name
+MANIFEST_COLUMNS = ["source", "sha256", "size", "mtime", "settings", "clf", "figure", "logger_type", "rows"]
+BLOCK_SIZE = 1 << 20 # read files in 1 MB blocks when hashing
+
+#####################
+# FINGERPRINTS      #
+#####################
+# sha256 of the file content
+def file_digest(path, block_size=BLOCK_SIZE):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# converter settings as a stable string, so a changed date gate or timezone triggers a rerun
+def settings_key(settings):
+    return json.dumps(settings, sort_keys=True, default=str)
+
+#####################
+# LOAD / SAVE       #
+#####################
+# returns {source filename: manifest row}, empty if there is no manifest yet
+def load_manifest(folder, name=MANIFEST_NAME):
+    path = os.path.join(folder, name)
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_csv(path, dtype={"sha256": str, "settings": str}, float_precision="round_trip") # mtime must survive exactly
+    return {row["source"]: row for row in df.to_dict("records")}
+
+def save_manifest(entries, folder, name=MANIFEST_NAME):
+    path = os.path.join(folder, name)
+    df = pd.DataFrame(list(entries), columns=MANIFEST_COLUMNS).sort_values("source")
+    df.to_csv(path, index=False)
+    return path
+
+#####################
+# CHANGE DETECTION  #
+#####################
+# checks a raw file against its manifest row
+# returns (up_to_date, row) where row carries the current size/mtime/hash and can be written back as is
+def check_file(entry, file_path, settings):
+    stat = os.stat(file_path)
+    current = {"size": stat.st_size, "mtime": stat.st_mtime, "settings": settings_key(settings)}
+    if entry is None or entry.get("settings") != current["settings"]:
+        return False, current
+    outputs = [entry.get("clf"), entry.get("figure")]
+    if not all(isinstance(p, str) and os.path.exists(p) for p in outputs):
+        return False, current
+    if entry.get("size") != current["size"]:
+        return False, current
+    if entry.get("mtime") == current["mtime"]:
+        return True, {**entry, **current} # untouched, no need to hash
+    current["sha256"] = file_digest(file_path) # touched but maybe not changed, e.g. copied again
+    return entry.get("sha256") == current["sha256"], {**entry, **current}
+
+# manifest row for a freshly converted file
+def manifest_entry(file_path, settings, **outputs):
+    stat = os.stat(file_path)
+    return {
+        "source": os.path.basename(file_path),
+        "sha256": file_digest(file_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "settings": settings_key(settings),
+        **outputs,
+    }
@@ -0,0 +1,100 @@
+# PURPOSE: RUN-LENGTH SMALL GAP FILL, ONLY NaN RUNS OF AT MOST limit ROWS ARE FILLED AND ALWAYS AS A WHOLE
+#
+# pandas interpolate(limit=20, limit_direction='both') also fills the first and last 20 rows of every longer gap,
+# so a 3 day hole got 5 h of straight line at both ends. here the NaN runs of a channel are labelled once
+# (start, length) and only runs of length <= limit are filled, in one vectorised pass over all runs:
+#   runs with a valid value on both sides   linear between the two, np.interp's formula
+#   runs at the start / end of the series   the nearest valid value (like limit_direction='both')
+#   longer runs                             untouched, they are real gaps
+# filled values are counted per run length bucket (FILL_BUCKETS), e.g. {"1": 40, "2-4": 12, "5-8": 0, ...}
+#
+# x is one sensor (time) or many sensors (time x sensor), runs never cross from one sensor into the next
+
+import numpy as np
+
+FILL_COLUMNS = ['t1', 't2', 't3', 'SMC']
+FILL_BUCKETS = [1, 4, 8, 20] # upper run lengths of the report buckets, longer runs go into the last bucket
+
+#####################
+# RUNS              #
+#####################
+# report labels of the buckets: "1", "2-4", "5-8", "9-20", ">20"
+def bucket_labels(buckets=FILL_BUCKETS):
+    labels = []
+    lower = 1
+    for upper in buckets:
+        labels.append(str(upper) if upper == lower else f"{lower}-{upper}")
+        lower = upper + 1
+    return labels + [f">{buckets[-1]}"]
+
+# NaN runs of x along axis 0, cover (same shape) limits them to the rows a sensor actually spans
+# returns (start, length, sensor) with start as a position in x.ravel(order='F'), runs in sensor and time order
+def nan_runs(x, cover=None):
+    n = x.shape[0]
+    missing = np.isnan(x) if cover is None else np.isnan(x) & cover
+    by_sensor = (missing[:, None] if x.ndim == 1 else missing).T # one row per sensor
+    edges = np.diff(np.pad(by_sensor, ((0, 0), (1, 1))).view(np.int8), axis=1)
+    sensor, start = np.nonzero(edges == 1)
+    _, end = np.nonzero(edges == -1)
+    return sensor * n + start, end - start, sensor
+
+#####################
+# FILL              #
+#####################
+# fills the NaN runs of x that are at most limit rows long in place, limit is a scalar or one value per sensor
+# returns the filled values per bucket, (buckets,) for one sensor and (sensors x buckets) for many
+# limit 0 fills nothing
+def fill_small_gaps_inplace(x, limit, cover=None, buckets=FILL_BUCKETS):
+    n = x.shape[0]
+    n_sensors = 1 if x.ndim == 1 else x.shape[1]
+    flat = x.ravel(order='F') # sensors one after the other, a view for 1D and column major 2D arrays
+    start, length, sensor = nan_runs(x, cover)
+    row = start - sensor * n
+    end = start + length
+    has_prev = row > 0
+    has_prev[has_prev] = ~np.isnan(flat[start[has_prev] - 1]) # a NaN outside cover is no neighbour
+    has_next = row + length < n
+    has_next[has_next] = ~np.isnan(flat[end[has_next]])
+    if np.ndim(limit):
+        limit = np.asarray(limit)[sensor] # one limit per sensor
+    fill = (length <= limit) & (has_prev | has_next)
+    start, length, sensor, has_prev, has_next = start[fill], length[fill], sensor[fill], has_prev[fill], has_next[fill]
+
+    # every filled row with the bounds of its run
+    left = np.where(has_prev, start - 1, start + length) # leading runs take the first valid value
+    right = np.where(has_next, start + length, start - 1) # trailing runs take the last valid value
+    at = np.repeat(start - np.cumsum(np.r_[0, length[:-1]]), length) + np.arange(length.sum())
+    left = np.repeat(left, length)
+    right = np.repeat(right, length)
+    values = flat[left]
+    interior = left != right
+    slope = (flat[right[interior]] - values[interior]) / (right[interior] - left[interior])
+    values[interior] = slope * (at[interior] - left[interior]) + values[interior] # np.interp's formula
+    flat[at] = values
+    if not np.shares_memory(flat, x):
+        x[...] = flat.reshape(x.shape, order='F')
+
+    bucket = np.searchsorted(buckets, length) # index of the first upper bound >= length
+    counts = np.zeros((n_sensors, len(buckets) + 1), dtype=np.int64)
+    np.add.at(counts, (sensor, bucket), length)
+    return counts[0] if x.ndim == 1 else counts
+
+# {label: filled values} of one sensor's bucket counts, for the reports
+def bucket_counts(counts, buckets=FILL_BUCKETS):
+    return {label: int(c) for label, c in zip(bucket_labels(buckets), counts)}
+
+#####################
+# FRAMES            #
+#####################
+# fills small gaps in the columns of a frame (in place), each channel is labelled and filled once
+# returns (df, filled, {label: filled values})
+def fill_small_gaps_frame(df, limit, columns=FILL_COLUMNS, buckets=FILL_BUCKETS):
+    counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+    for col in columns:
+        if col in df.columns:
+            x = df[col].to_numpy(dtype=float, copy=True)
+            col_counts = fill_small_gaps_inplace(x, limit, buckets=buckets)
+            if col_counts.any(): # untouched columns keep their dtype
+                df[col] = x
+            counts += col_counts
+    return df, int(counts.sum()), bucket_counts(counts, buckets)
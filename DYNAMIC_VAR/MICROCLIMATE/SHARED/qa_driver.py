@@ -0,0 +1,410 @@
+# PURPOSE: THE big_QA DRIVER (QA STEPS, FIGURE, EXPORT, CACHE, POOL, REPORT), SHARED BY big_QA AND big_QA_alt
+#
+# the two QA scripts only differ in their rule profile and cache stage, they are configuration shims that build a
+# stage with qa_stage() and call process_folder(). everything a stage carries is plain data, so it pickles into
+# the worker processes:
+#   name         cache sub folder and stage name of the script
+#   profile      rule profile in qa_rules.csv
+#   rules        the rule rows of that profile, params is what the results store and the cache key see of them
+#   code         code_version() of the script, the cache is invalidated when it or a shared module it uses changes
+#   export_csv   also write the legacy CLF .csv next to the CLF v2 .parquet
+#
+# the step functions 0-5 are the readable reference of the pipeline, run_QA_pipeline() runs them in one pass over
+# contiguous arrays (SHARED/qa_kernel.py) with the same results and report stats
+
+import os
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from clf_io import read_clf, write_clf, list_clf_files, clf_name, clf_stem, parse_clf_name
+from clf_figures import line_trace, write_figure, ensure_plotlyjs
+from gap_index import build_gap_index, large_gaps
+from gap_fill import fill_small_gaps_frame
+from qa_kernel import run_qa_kernel, run_network_kernel
+from qa_rules import RULES_FILE, load_rules, compile_rules
+from results_store import STORE_NAME, content_hash, upsert
+from stage_cache import CACHE_BUDGET, code_version, stage_key, try_store, restore, evict
+
+# QA report columns, failed files only fill file and error
+REPORT_COLUMNS = ["logger_type", "missing_timestamps_inserted", "large_time_gaps", "non15min_removed",
+                  "insane_values_removed", "jump_values_removed", "incomplete_rows",
+                  "duplicate_timestamps_removed", "small_gaps_filled", "small_gaps_filled_by_length", "file", "figure", "error"]
+
+#####################
+# STAGE             #
+#####################
+# settings of one QA script, script_path is the script's __file__
+def qa_stage(script_path, name, profile, export_csv=False, rules_file=RULES_FILE):
+    rules = load_rules(rules_file, profile=profile)
+    return {
+        "name": name,
+        "profile": profile,
+        "rules": rules,
+        "params": {"rules": rules.to_dict("records")}, # parameter set of the results store and the cache key
+        "code": code_version(script_path),
+        "export_csv": export_csv,
+    }
+
+#####################
+# LOGGER TYPE       #
+#####################
+# this is only useful for the report, and it only works if file are in CLF
+def detect_logger_type(df):
+    # TL = t1, t2, SMC all NaN
+    if df[['t1','t2','SMC']].isna().all().all():
+        return "TL"
+    return "TMS"
+
+#####################
+# QA STEPS          #
+#####################
+# 0. DETECT & INSERT MISSING TIMESTAMPS
+def detect_and_insert_missing_timestamps(df, freq="15min", small_gap_limit=20):
+    df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+    df = df.sort_values('datetime')
+
+    full_range = pd.date_range(
+        start=df['datetime'].min(),
+        end=df['datetime'].max(),
+        freq=freq,
+        tz="UTC"
+    )
+
+    # Reindex → inserts missing timestamps as rows with NaN values
+    df_full = df.set_index('datetime').reindex(full_range)
+    df_full.index.name = 'datetime'
+    df_full = df_full.reset_index()
+
+    # Count how many timestamps were inserted
+    inserted = len(full_range) - full_range.isin(df['datetime']).sum()
+
+    # --- Detect large gaps (for reporting) ---
+    # one array pass over the timestamp differences (SHARED/gap_index.py)
+    gap_index = build_gap_index(df['datetime'], freq=freq)
+    gaps = large_gaps(gap_index, small_gap_limit)
+
+    return df_full, inserted, gaps
+
+# 1. ENFORCE 15-MINUTE TIMESTAMPS
+# delete non 15-mins timestamps because they will be faulty
+def enforce_15min(df):
+    df['datetime'] = pd.to_datetime(df['datetime'], utc=True)
+    mask = df['datetime'].dt.minute % 15 == 0
+    removed = len(df) - mask.sum()
+    return df[mask].copy(), removed
+
+# 2. REMOVE INSANE VALUES & JUMPS
+# ranges {col: (min, max)} and jumps {col: max step} of a stage, compile_rules(stage["rules"])
+def remove_insane_and_jumps(df, ranges, jumps):
+    insane_count = 0
+    jump_count = 0
+    for col, (valid_min, valid_max) in ranges.items():
+
+        max_jump = jumps[col]
+
+        # Impossible absolute values
+        insane_mask = (df[col] < valid_min) | (df[col] > valid_max)
+        insane_count += insane_mask.sum()
+        df.loc[insane_mask, col] = np.nan
+
+        # Step jumps > allowed threshold
+        diffs = df[col].diff().abs()
+        jump_mask = diffs > max_jump
+        jump_count += jump_mask.sum()
+        df.loc[jump_mask, col] = np.nan
+
+    return df, insane_count, jump_count
+
+# 3. DETECT INCOMPLETE ROWS (NO DROPPING)
+def count_incomplete_rows(df, logger_type):
+    # this doesnt delete rows or anything, it just counts...maybe superfluous
+    if logger_type == "TL":
+        incomplete = df['t3'].isna()
+    else:
+        incomplete = df[['t1','t2','t3']].isna().any(axis=1)
+
+    return incomplete.sum()
+
+# 4. DELETE DUPLICATE TIMESTAMPS
+# these are usually sensor bugs
+def remove_duplicate_timestamps(df):
+    before = len(df)
+    df = df.sort_values('datetime')
+    df = df[~df['datetime'].duplicated(keep='first')]
+    removed = before - len(df)
+    return df, removed
+
+# 5. FILL SMALL GAPS (<20 rows)
+# fill gaps that dont exceed 20 entries (3 hours)
+# this only fills row entries with NaNs, i.e., stuff that got removed earlier or is just there
+# longer gaps stay completely empty, their edges are not filled either (SHARED/gap_fill.py)
+def fill_small_gaps(df, limit=20):
+    df, filled, _ = fill_small_gaps_frame(df, limit)
+    return df, filled
+
+# runs steps 0-5 in one pass over contiguous arrays (SHARED/qa_kernel.py) instead of chaining the functions above,
+# which copy the whole frame at every step; results and report stats are the same
+# thresholds are the rules of the logger type and sensor (serial)
+def run_QA_pipeline(df, rules, sensor=None):
+    logger_type = detect_logger_type(df)
+    df, stats = run_qa_kernel(df, logger_type, compile_rules(rules, logger_type, sensor))
+    return df, {"logger_type": logger_type, **stats}
+
+#####################
+# FIGURE            #
+#####################
+## figure script from TOMST
+def create_interactive_figure(df, logger_type, filename, cleaned_filename, figure_folder):
+    fig = go.Figure()
+
+    # Always plot t3 (air)
+    # traces are decimated per pixel bucket (clf_figures.py), gaps stay visible
+    fig.add_trace(line_trace(df, 't3', name='T air'))
+
+    # TMS has t1/t2
+    if logger_type == 'TMS':
+        fig.add_trace(line_trace(df, 't2', name='T surface'))
+        fig.add_trace(line_trace(df, 't1', name='T soil'))
+
+    # Layout with summer shading
+    fig.update_layout(
+        shapes=[
+            dict(
+                type="rect",
+                xref="x",
+                yref="paper",
+                x0="2024-05-15",
+                x1="2024-09-15",
+                y0=0,
+                y1=1,
+                fillcolor="yellow",
+                opacity=0.2,
+                line_width=0,
+            )
+        ],
+        annotations=[
+            dict(
+                x='2024-07-15',
+                y=1.05,
+                xref='x',
+                yref='paper',
+                text='Summer 24',
+                showarrow=False,
+                font=dict(size=14, color="yellow"),
+                align="center"
+            )
+        ],
+        title=f"{'Air temperature' if logger_type == 'TL' else 'Soil, surface, air temperature'}, {filename}",
+        xaxis_title='Date',
+        yaxis_title='Temperature (°C)',
+        hovermode='x unified',
+        template='plotly_dark',
+        height=700,
+        width=1200
+    )
+
+    # File naming
+    figure_name = f"{clf_stem(cleaned_filename)}_fig.html"
+    figure_path = os.path.join(figure_folder, figure_name)
+
+    # Save interactive figure, plotly.min.js is shared by all figures in the folder
+    write_figure(fig, figure_path)
+
+    return figure_path
+
+#####################
+# EXPORT            #
+#####################
+# serial in a CLF file name, None if the name does not follow the CLF pattern
+def sensor_serial(file):
+    name = parse_clf_name(file)
+    return None if name is None else name["serial"]
+
+# writes the cleaned CLF file and its figure, returns the finished report row
+def export_file(stage, file, df_clean, stats, output_folder, figure_folder):
+    # Save cleaned CSV
+    cleaned_name = clf_name(file, "_QA")
+    cleaned_path = os.path.join(output_folder, cleaned_name)
+    write_clf(df_clean, cleaned_path, export_csv=stage["export_csv"])
+
+    # Save figure
+    fig_path = create_interactive_figure(
+        df_clean,
+        stats["logger_type"],
+        filename=file,
+        cleaned_filename=cleaned_name,
+        figure_folder=figure_folder
+    )
+
+    # Add to report row
+    stats["file"] = file
+    stats["figure"] = fig_path
+    stats["error"] = ""
+    return stats
+
+#####################
+# RESULT CACHE      #
+#####################
+# key of a file: its content, the stage code, the rules and the export settings (SHARED/stage_cache.py)
+def cache_key(stage, file, file_hash):
+    return stage_key(file_hash, stage["code"], {**stage["params"], "file": file, "export_csv": stage["export_csv"]})
+
+# report row of a file whose cleaned CLF and figure were copied back from the cache, None if not cached
+def restore_file(stage, file, file_hash, output_folder, figure_folder, cache_folder):
+    hit = restore(cache_folder, stage["name"], cache_key(stage, file, file_hash),
+                  {"clf": output_folder, "csv": output_folder, "figure": figure_folder})
+    if hit is None:
+        return None
+    stats, restored = hit
+    ensure_plotlyjs(figure_folder)
+    return {**stats, "file": file, "figure": restored["figure"], "error": "", "content_hash": file_hash, "cached": True}
+
+# caches the outputs and stats of a freshly QA'd file, a failed cache write only warns, the file stays processed
+def cache_file(stage, row, output_folder, cache_folder):
+    clf_path = os.path.join(output_folder, clf_name(row["file"], "_QA"))
+    outputs = {"clf": clf_path, "csv": f"{clf_stem(clf_path)}.csv" if stage["export_csv"] else None, "figure": row["figure"]}
+    stats = {k: v for k, v in row.items() if k not in ("file", "figure", "error", "content_hash")}
+    try_store(cache_folder, stage["name"], cache_key(stage, row["file"], row["content_hash"]), stats, outputs)
+
+#####################
+# QA OF ONE FILE    #
+#####################
+# defined on module level so the worker processes can pickle it
+# a file that fails is reported with its error instead of stopping the whole run
+# with a cache_folder, unchanged files are restored instead of QA'd
+def process_file(file, stage, source_folder, output_folder, figure_folder, cache_folder=None):
+    try:
+        in_path = os.path.join(source_folder, file)
+        file_hash = content_hash(in_path)
+        if cache_folder is not None:
+            row = restore_file(stage, file, file_hash, output_folder, figure_folder, cache_folder)
+            if row is not None:
+                return row
+        df = read_clf(in_path)
+
+        # Run QA
+        df_clean, stats = run_QA_pipeline(df, stage["rules"], sensor=sensor_serial(file))
+        row = {**export_file(stage, file, df_clean, stats, output_folder, figure_folder), "content_hash": file_hash}
+        if cache_folder is not None:
+            cache_file(stage, row, output_folder, cache_folder)
+        return row
+    except Exception as e:
+        return {"file": file, "error": f"{type(e).__name__}: {e}"}
+
+# export step of network mode, same error handling and caching as process_file
+def export_network_file(item, stage, output_folder, figure_folder, cache_folder=None):
+    file, (df_clean, stats) = item
+    try:
+        row = export_file(stage, file, df_clean, stats, output_folder, figure_folder)
+        if cache_folder is not None:
+            cache_file(stage, row, output_folder, cache_folder)
+        return row
+    except Exception as e:
+        return {"file": file, "error": f"{type(e).__name__}: {e}"}
+
+#####################
+# NETWORK QA        #
+#####################
+# reads every file and QAs all sensors at once (SHARED/qa_kernel.py run_network_kernel)
+# returns [(file, (df_clean, stats))] in file order and {file: report row} of the files that are already done:
+# restored from the cache (cache_folder) or failed to read
+def qa_network(files, stage, source_folder, output_folder, figure_folder, cache_folder=None):
+    frames = {}
+    logger_types = {}
+    hashes = {}
+    done = {}
+    for file in files:
+        try:
+            hashes[file] = content_hash(os.path.join(source_folder, file))
+            if cache_folder is not None:
+                row = restore_file(stage, file, hashes[file], output_folder, figure_folder, cache_folder)
+                if row is not None:
+                    done[file] = row
+                    continue
+            frames[file] = read_clf(os.path.join(source_folder, file))
+            logger_types[file] = detect_logger_type(frames[file])
+        except Exception as e:
+            done[file] = {"file": file, "error": f"{type(e).__name__}: {e}"}
+            frames.pop(file, None)
+    rules = {file: compile_rules(stage["rules"], logger_types[file], sensor_serial(file)) for file in frames}
+    results = run_network_kernel(frames, logger_types, rules)
+    items = []
+    for file, (df_clean, stats) in results.items():
+        items.append((file, (df_clean, {"logger_type": logger_types[file], **stats, "content_hash": hashes[file]})))
+    return items, done
+
+# report rows in file order, files that were done before the pool (cached, failed) get their row back in place
+def merge_done(files, results, done):
+    results = iter(results)
+    for file in files:
+        yield done[file] if file in done else next(results)
+
+#####################
+# FOLDER LOOP       #
+#####################
+# files are QA'd in parallel if n_workers > 1, report rows come back in file order
+# network=True QAs all files together in this process and only exports in parallel
+# cache_folder: files whose content, code and rules did not change are restored instead of QA'd (SHARED/stage_cache.py)
+def process_folder(stage, source_folder, output_folder, report_folder, figure_folder, n_workers=1, network=False,
+                   cache_folder=None, cache_budget=CACHE_BUDGET):
+
+    files = list_clf_files(source_folder)
+    if network:
+        # all files are read first, the network kernel QAs them together and the pool only exports
+        items, done = qa_network(files, stage, source_folder, output_folder, figure_folder, cache_folder)
+        worker = partial(export_network_file, stage=stage, output_folder=output_folder, figure_folder=figure_folder,
+                         cache_folder=cache_folder)
+    else:
+        items, done = files, {}
+        worker = partial(process_file,
+                         stage=stage,
+                         source_folder=source_folder,
+                         output_folder=output_folder,
+                         figure_folder=figure_folder,
+                         cache_folder=cache_folder)
+
+    if n_workers is None or n_workers > 1:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(worker, items) # map yields in submission order
+    else:
+        pool = None
+        results = map(worker, items)
+    results = merge_done(files, results, done)
+
+    report_rows = []
+    try:
+        for i, row in enumerate(results, start=1):
+            report_rows.append(row)
+            if row["error"]:
+                print(f"[{i}/{len(files)}] FAILED {row['file']}: {row['error']}")
+            elif row.get("cached"):
+                print(f"[{i}/{len(files)}] Unchanged {row['file']}, restored from cache")
+            else:
+                print(f"[{i}/{len(files)}] Processed {row['file']} → {os.path.basename(row['figure'])}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Compile QA report
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_name = f"QA_report_{timestamp}.csv"
+    report_df = pd.DataFrame(report_rows, columns=REPORT_COLUMNS)
+    counts = [c for c in REPORT_COLUMNS if c not in ("logger_type", "large_time_gaps", "small_gaps_filled_by_length",
+                                                      "file", "figure", "error")]
+    report_df[counts] = report_df[counts].astype("Int64") # stay integers next to failed rows
+    report_path = os.path.join(report_folder, report_name)
+    report_df.to_csv(report_path, index=False)
+
+    # results store next to the reports, keyed by file content + the stage's rules, reruns update their rows in place
+    stored = [{**row, "sensor": sensor_serial(row["file"])} for row in report_rows if not row["error"]]
+    upsert(os.path.join(report_folder, STORE_NAME), "qa_report", stored, stage["params"])
+    if cache_folder is not None:
+        evict(cache_folder, cache_budget) # least recently used entries beyond the disk budget
+
+    failed = (report_df["error"] != "").sum()
+    print("\n====================================")
+    print(f" QA COMPLETE, CHECK FILES ({failed} of {len(files)} FAILED)" if failed else " QA COMPLETE, CHECK FILES")
+    print("====================================")
@@ -0,0 +1,240 @@
+# PURPOSE: ONE-PASS QA OF A CLF FRAME ON CONTIGUOUS FLOAT ARRAYS, SHARED BY big_QA AND big_QA_alt
+#
+# the step functions of big_QA in qa_driver.py (reindex, mask + copy, sort, .loc, interpolate) each copy the whole frame
+# here every column is loaded once into a float array on the regular grid and all steps work in place:
+#   duplicates -> insert missing -> 15 min enforcement -> range -> jump -> incomplete rows -> small gap fill
+# results and stats are the same as chaining the step functions, the only DataFrame built is the returned one
+# small gaps are filled by run length (SHARED/gap_fill.py): only NaN runs of at most fill_limit rows, as a whole
+#
+# network mode stacks many sensors into one (time x sensor) array per channel on the shared 15 min UTC grid
+# and runs the same rules as whole-array operations, per sensor results are identical to the single sensor kernel
+# thresholds come from compiled rules (SHARED/qa_rules.py), all rules of a channel are applied in one pass over it
+
+import numpy as np
+import pandas as pd
+from gap_index import build_gap_index, large_gaps, utc_stamps
+from qa_rules import stack_rules
+from gap_fill import fill_small_gaps_inplace, bucket_counts, FILL_BUCKETS
+
+STACK_COLUMNS = ['t1', 't2', 't3', 'SMC'] # channels the network kernel stacks
+NS_PER_MINUTE = 60 * 10**9
+NETWORK_BATCH = 64 # sensors stacked at once, bounds memory to ~ grid rows x batch x 8 bytes per channel
+
+# sorted unique timestamps (int64 ns) of a frame, the source row of each and the number of dropped duplicates
+# stable sort, so the first row of every timestamp is kept
+def _unique_stamps(df):
+    stamps = pd.to_datetime(df['datetime'], utc=True, cache=False).dt.tz_convert(None) # no cache, it iterates the values
+    ns = stamps.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    order = np.argsort(ns, kind="stable")
+    ns = ns[order]
+    first = np.r_[True, ns[1:] != ns[:-1]]
+    return ns[first], order[first], int((~first).sum())
+
+#####################
+# ARRAY RULES       #
+#####################
+# x is one sensor (time) or many sensors (time x sensor), rules work along axis 0 and count per sensor
+# thresholds are scalars or one value per sensor
+
+# values outside [valid_min, valid_max] and steps larger than max_jump become NaN
+# jumps are measured on the range checked values, returns (insane, jump) counts
+def range_and_jump_inplace(x, valid_min, valid_max, max_jump):
+    insane = (x < valid_min) | (x > valid_max)
+    x[insane] = np.nan
+    jump = np.zeros(x.shape, dtype=bool)
+    jump[1:] = np.abs(np.diff(x, axis=0)) > max_jump
+    x[jump] = np.nan
+    return insane.sum(axis=0), jump.sum(axis=0)
+
+# rows with a missing temperature, TL loggers only have t3
+def incomplete_rows(column, logger_type):
+    if logger_type == "TL":
+        return np.isnan(column['t3'])
+    return np.isnan(column['t1']) | np.isnan(column['t2']) | np.isnan(column['t3'])
+
+#####################
+# QA KERNEL         #
+#####################
+# insert missing + 15 min enforcement: scatters the unique rows (ns, order) onto the grid t0 + k * step
+# rows off the grid fall away like in reindex, then grid stamps off the 15 min clock are dropped
+# returns (grid (column x row), grid_ns, kept_slots, n_grid, n_on_grid)
+def _to_grid(df, value_columns, ns, order, step):
+    t0 = ns[0]
+    n_grid = int((ns[-1] - t0) // step) + 1
+    on_grid = (ns - t0) % step == 0
+    slots = (ns[on_grid] - t0) // step
+    rows = order[on_grid]
+    grid = np.full((len(value_columns), n_grid), np.nan)
+    for i, col in enumerate(value_columns):
+        grid[i, slots] = df[col].to_numpy(dtype=float)[rows]
+    grid_ns = t0 + np.arange(n_grid, dtype=np.int64) * step
+
+    keep = (grid_ns // NS_PER_MINUTE) % 60 % 15 == 0 # minute of the grid stamps must be a multiple of 15
+    if not keep.all():
+        grid = np.ascontiguousarray(grid[:, keep])
+        grid_ns = grid_ns[keep]
+    return grid, grid_ns, np.flatnonzero(keep), n_grid, len(slots)
+
+# df: CLF frame of one sensor, rules: compile_rules() of its logger (ranges, jumps, fill_limits, small_gap_limit)
+# logger_type decides which columns make a row incomplete (TL: t3 only)
+# returns the QA'd frame and the stats of run_QA_pipeline (without logger_type)
+def run_qa_kernel(df, logger_type, rules, freq="15min"):
+    value_columns = [c for c in df.columns if c != 'datetime']
+    ns, order, duplicates_removed = _unique_stamps(df)
+    gap_index = build_gap_index(pd.Series(utc_stamps(ns)), freq=freq)
+    grid, grid_ns, kept_slots, n_grid, n_on_grid = _to_grid(df, value_columns, ns, order, pd.Timedelta(freq).value)
+    inserted_missing = n_grid - n_on_grid
+    removed_15min = int(n_grid - len(kept_slots))
+    column = {col: grid[i] for i, col in enumerate(value_columns)} # views, edits go straight into grid
+
+    # range and jump checks
+    insane_removed = 0
+    jump_removed = 0
+    for col, (valid_min, valid_max) in rules["ranges"].items():
+        if col in column:
+            insane, jump = range_and_jump_inplace(column[col], valid_min, valid_max, rules["jumps"][col])
+            insane_removed += int(insane)
+            jump_removed += int(jump)
+
+    # incomplete rows, counted only
+    incomplete = int(incomplete_rows(column, logger_type).sum())
+
+    # small gap fill
+    filled = np.zeros(len(FILL_BUCKETS) + 1, dtype=np.int64)
+    for col, limit in rules["fill_limits"].items():
+        if col in column:
+            filled += fill_small_gaps_inplace(column[col], limit)
+
+    out = pd.DataFrame({'datetime': utc_stamps(grid_ns)}, index=kept_slots)
+    for col in value_columns:
+        values = column[col]
+        dtype = df[col].dtype
+        if n_on_grid == n_grid and dtype.kind in "iub": # reindex keeps int flags when no row was inserted
+            values = values.astype(dtype)
+        out[col] = values
+
+    return out, {
+        "missing_timestamps_inserted": inserted_missing,
+        "large_time_gaps": large_gaps(gap_index, rules["small_gap_limit"]),
+        "non15min_removed": removed_15min,
+        "insane_values_removed": insane_removed,
+        "jump_values_removed": jump_removed,
+        "incomplete_rows": incomplete,
+        "duplicate_timestamps_removed": duplicates_removed,
+        "small_gaps_filled": int(filled.sum()),
+        "small_gaps_filled_by_length": bucket_counts(filled),
+    }
+
+#####################
+# NETWORK KERNEL    #
+#####################
+# frames: {name: CLF frame}, logger_types: {name: TL/TMS}, rules: {name: compile_rules() of that sensor}
+# returns {name: (QA'd frame, stats)} in input order
+# sensors that do not start on the 15 min grid or carry extra columns go through run_qa_kernel on their own
+def run_network_kernel(frames, logger_types, rules, freq="15min", batch=NETWORK_BATCH):
+    step = pd.Timedelta(freq).value
+    results = {}
+    stacked = []
+    for name, df in frames.items():
+        if set(df.columns) <= {'datetime', *STACK_COLUMNS} and len(df):
+            ns, order, duplicates = _unique_stamps(df)
+            if ns[0] % step == 0:
+                stacked.append((name, ns, order, duplicates))
+                continue
+        results[name] = run_qa_kernel(df, logger_types[name], rules[name], freq)
+
+    for b in range(0, len(stacked), batch):
+        results.update(_network_batch(stacked[b:b + batch], frames, logger_types, rules, step, freq))
+    return {name: results[name] for name in frames}
+
+# one batch of sensors, all sensors share the grid t0 + k * step and thresholds are one value per sensor
+def _network_batch(stacked, frames, logger_types, rules, step, freq):
+    t0 = min(ns[0] for _, ns, _, _ in stacked)
+    first = np.array([(ns[0] - t0) // step for _, ns, _, _ in stacked])
+    last = np.array([(ns[-1] - t0) // step for _, ns, _, _ in stacked])
+    n_grid = int(last.max()) + 1
+    n_sensors = len(stacked)
+    grid_rows = np.arange(n_grid)[:, None]
+    cover = (grid_rows >= first) & (grid_rows <= last) # rows each sensor spans
+
+    # time x sensor array per channel, rows off the 15 min grid fall away like in reindex
+    column = {col: np.full((n_grid, n_sensors), np.nan, order='F') for col in STACK_COLUMNS} # each sensor contiguous in time
+    n_on_grid = np.zeros(n_sensors, dtype=np.int64)
+    for s, (name, ns, order, _) in enumerate(stacked):
+        on_grid = ns % step == 0
+        slots = (ns[on_grid] - t0) // step
+        rows = order[on_grid]
+        n_on_grid[s] = len(slots)
+        df = frames[name]
+        for col in STACK_COLUMNS:
+            if col in df.columns:
+                column[col][slots, s] = df[col].to_numpy(dtype=float)[rows]
+
+    # range and jump checks on whole channels
+    batch_rules = stack_rules([rules[name] for name, _, _, _ in stacked])
+    insane = np.zeros(n_sensors, dtype=np.int64)
+    jump = np.zeros(n_sensors, dtype=np.int64)
+    for col, (valid_min, valid_max) in batch_rules["ranges"].items():
+        if col in column:
+            col_insane, col_jump = range_and_jump_inplace(column[col], valid_min, valid_max, batch_rules["jumps"][col])
+            insane += col_insane
+            jump += col_jump
+
+    # incomplete rows, TL sensors only count t3
+    is_tl = np.array([logger_types[name] == "TL" for name, _, _, _ in stacked])
+    incomplete = np.where(is_tl, np.isnan(column['t3']), incomplete_rows(column, "TMS")) & cover
+
+    # small gap fill, only inside each sensor's span
+    filled = np.zeros((n_sensors, len(FILL_BUCKETS) + 1), dtype=np.int64)
+    for col, limit in batch_rules["fill_limits"].items():
+        if col in column:
+            filled += fill_small_gaps_inplace(column[col], limit, cover=cover)
+
+    grid_ns = t0 + np.arange(n_grid, dtype=np.int64) * step
+    results = {}
+    for s, (name, ns, _, duplicates) in enumerate(stacked):
+        span = slice(first[s], last[s] + 1)
+        out = pd.DataFrame({'datetime': utc_stamps(grid_ns[span])})
+        for col in frames[name].columns:
+            if col != 'datetime':
+                out[col] = column[col][span, s]
+        gap_index = build_gap_index(pd.Series(utc_stamps(ns)), freq=freq)
+        results[name] = (out, {
+            "missing_timestamps_inserted": int(last[s] - first[s] + 1 - n_on_grid[s]),
+            "large_time_gaps": large_gaps(gap_index, batch_rules["small_gap_limit"][s]),
+            "non15min_removed": 0,
+            "insane_values_removed": int(insane[s]),
+            "jump_values_removed": int(jump[s]),
+            "incomplete_rows": int(incomplete[:, s].sum()),
+            "duplicate_timestamps_removed": duplicates,
+            "small_gaps_filled": int(filled[s].sum()),
+            "small_gaps_filled_by_length": bucket_counts(filled[s]),
+        })
+    return results
+
+#####################
+# THRESHOLD SWEEP   #
+#####################
+# channels of df on the QA grid (duplicates removed, missing stamps inserted, 15 min enforced), {col: array}
+# the arrays range_and_jump_inplace sees in run_qa_kernel
+def qa_grid(df, columns, freq="15min"):
+    ns, order, _ = _unique_stamps(df)
+    grid, _, _, _, _ = _to_grid(df, columns, ns, order, pd.Timedelta(freq).value)
+    return {col: grid[i] for i, col in enumerate(columns)}
+
+# range and jump counts of one channel for every combination of ranges [(min, max), ...] and jumps [max, ...]
+# same counts as range_and_jump_inplace, x is left unchanged; returns insane (range,) and jump (range x jump)
+# thresholds are compared against the sorted values and steps (searchsorted) instead of one mask per combination,
+# so a sweep costs one sort per range and memory stays at the length of the series
+def sweep_range_and_jump(x, ranges, jumps):
+    jumps = np.asarray(jumps, dtype=float)
+    values = np.sort(x[~np.isnan(x)])
+    insane = np.empty(len(ranges), dtype=np.int64)
+    jump = np.empty((len(ranges), len(jumps)), dtype=np.int64)
+    for r, (valid_min, valid_max) in enumerate(ranges):
+        insane[r] = np.searchsorted(values, valid_min, 'left') + len(values) - np.searchsorted(values, valid_max, 'right')
+        checked = np.where((x < valid_min) | (x > valid_max), np.nan, x) # jumps are measured on range checked values
+        steps = np.abs(np.diff(checked))
+        steps = np.sort(steps[~np.isnan(steps)])
+        jump[r] = len(steps) - np.searchsorted(steps, jumps, 'right')
+    return insane, jump
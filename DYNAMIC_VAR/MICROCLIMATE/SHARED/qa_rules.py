@@ -0,0 +1,79 @@
+# PURPOSE: QA THRESHOLDS AS DATA, ONE RULE FILE (qa_rules.csv) SHARED BY big_QA, big_QA_alt AND outlier_detection
+#
+# one row per profile (QA script) and channel, semicolon separated like the other hand edited tables:
+#   valid_min, valid_max   plausible range, values outside become NaN / are flagged
+#   max_jump               largest allowed step between consecutive 15 min rows
+#   fill_limit             NaN runs up to this many rows away from a valid value are interpolated
+#   gap_limit              (channel datetime) time gaps longer than this many 15 min intervals are reported
+# empty fields mean no rule. rows with a logger_type and/or sensor (serial) only apply to those loggers and
+# override the general rows field by field: general < logger_type < sensor < logger_type + sensor
+# compile_rules turns the rows of one logger into the plain dicts/arrays the QA kernel applies in one pass per channel
+
+import os
+import numpy as np
+import pandas as pd
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "qa_rules.csv")
+RULE_COLUMNS = ["profile", "logger_type", "sensor", "channel", "valid_min", "valid_max", "max_jump", "fill_limit", "gap_limit"]
+RANGE_FIELDS = ["valid_min", "valid_max", "max_jump"]
+DEFAULT_GAP_LIMIT = 20 # used when a profile has no datetime gap_limit
+
+#####################
+# LOAD              #
+#####################
+# rule rows of one profile (None = all profiles), checked for missing columns and inverted ranges
+def load_rules(path=RULES_FILE, profile=None):
+    rules = pd.read_csv(path, sep=";", dtype={"profile": str, "logger_type": str, "sensor": str, "channel": str})
+    missing = [c for c in RULE_COLUMNS if c not in rules.columns]
+    if missing:
+        raise ValueError(f"{path}: missing rule columns {missing}")
+    if profile is not None:
+        rules = rules[rules["profile"] == profile]
+        if rules.empty:
+            raise ValueError(f"{path}: no rules for profile {profile}")
+    inverted = rules["valid_min"] > rules["valid_max"]
+    if inverted.any():
+        raise ValueError(f"{path}: valid_min > valid_max for {rules.loc[inverted, 'channel'].tolist()}")
+    return rules.reset_index(drop=True)
+
+#####################
+# COMPILE           #
+#####################
+# rules of one logger, {"ranges": {col: (min, max)}, "jumps": {col: max}, "fill_limits": {col: rows}, "small_gap_limit": n}
+# channels with only some range fields get open bounds (-inf/inf) for the others, so every check is a plain comparison
+def compile_rules(rules, logger_type=None, sensor=None):
+    lt = rules["logger_type"]
+    se = rules["sensor"]
+    match = (lt.isna() | (lt == logger_type)) & (se.isna() | (se == (None if sensor is None else str(sensor))))
+    specificity = lt.notna().astype(int) + 2 * se.notna().astype(int)
+    order = specificity[match].sort_values(kind="stable").index
+
+    fields = {}
+    for row in rules.loc[order].to_dict("records"): # more specific rows come later and win
+        fields.setdefault(row["channel"], {}).update(
+            {f: row[f] for f in RANGE_FIELDS + ["fill_limit", "gap_limit"] if pd.notna(row[f])})
+
+    compiled = {"ranges": {}, "jumps": {}, "fill_limits": {}, "small_gap_limit": DEFAULT_GAP_LIMIT}
+    for channel, f in fields.items():
+        if channel == "datetime":
+            compiled["small_gap_limit"] = int(f.get("gap_limit", DEFAULT_GAP_LIMIT))
+            continue
+        if any(k in f for k in RANGE_FIELDS):
+            compiled["ranges"][channel] = (float(f.get("valid_min", -np.inf)), float(f.get("valid_max", np.inf)))
+            compiled["jumps"][channel] = float(f.get("max_jump", np.inf))
+        if "fill_limit" in f:
+            compiled["fill_limits"][channel] = int(f["fill_limit"])
+    return compiled
+
+# compiled rules of many sensors as one array per channel and rule (one entry per sensor), for the network kernel
+# a sensor without a rule for a channel gets open bounds and no fill
+def stack_rules(compiled):
+    channels = sorted({c for r in compiled for c in r["ranges"]})
+    fill_channels = sorted({c for r in compiled for c in r["fill_limits"]})
+    return {
+        "ranges": {c: (np.array([r["ranges"].get(c, (-np.inf, np.inf))[0] for r in compiled]),
+                       np.array([r["ranges"].get(c, (-np.inf, np.inf))[1] for r in compiled])) for c in channels},
+        "jumps": {c: np.array([r["jumps"].get(c, np.inf) for r in compiled]) for c in channels},
+        "fill_limits": {c: np.array([r["fill_limits"].get(c, 0) for r in compiled]) for c in fill_channels},
+        "small_gap_limit": np.array([r["small_gap_limit"] for r in compiled]),
+    }
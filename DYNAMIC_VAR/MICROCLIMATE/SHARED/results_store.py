@@ -0,0 +1,102 @@
+# PURPOSE: SMALL SQLITE STORE FOR QA AND OUTLIER SUMMARIES, RERUNS UPDATE THEIR ROWS INSTEAD OF APPENDING
+#
+# every row is keyed by (content_hash, params_hash):
+#   content_hash   sha256 of the input file, the same file under another name or folder is the same row
+#   params_hash    sha256 of the parameter set (thresholds, rule rows, ...) as stable json, stored next to it as params
+# rerunning a file with the same parameters overwrites its row (upsert), a new parameter set adds rows next to the old ones
+# tables are indexed by (params_hash, sensor), so "outlier count by sensor for parameter set X" is an index lookup
+#
+# sqlite locks poorly on network shares: only the main process of a script writes, workers just return rows
+
+import json
+import sqlite3
+import hashlib
+import pandas as pd
+from datetime import datetime
+from file_manifest import file_digest, settings_key
+
+STORE_NAME = "qa_results.sqlite"
+KEY_COLUMNS = ["content_hash", "params_hash"]
+META_COLUMNS = ["params", "updated"]
+
+# value columns of each table, the key and meta columns are added to all of them
+TABLES = {
+    "outlier_summary": ["filename", "sensor", "outlier_count"],
+    "qa_report": ["file", "sensor", "logger_type", "missing_timestamps_inserted", "large_time_gaps", "non15min_removed",
+                  "insane_values_removed", "jump_values_removed", "incomplete_rows",
+                  "duplicate_timestamps_removed", "small_gaps_filled", "small_gaps_filled_by_length", "figure"],
+}
+
+#####################
+# KEYS              #
+#####################
+# sha256 of a parameter set (dict), order of the keys does not matter
+def params_hash(params):
+    return hashlib.sha256(settings_key(params).encode("utf-8")).hexdigest()
+
+# sha256 of a file's content
+def content_hash(path):
+    return file_digest(path)
+
+#####################
+# CONNECTION        #
+#####################
+# opens (and creates) the store with all tables and indices
+# columns added to TABLES later are added to older stores, their old rows read NULL there
+def connect(path):
+    con = sqlite3.connect(path)
+    for table, columns in TABLES.items():
+        all_columns = ", ".join(KEY_COLUMNS + columns + META_COLUMNS)
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({all_columns}, PRIMARY KEY ({', '.join(KEY_COLUMNS)}))")
+        existing = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+        for column in columns:
+            if column not in existing:
+                con.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        con.execute(f"CREATE INDEX IF NOT EXISTS {table}_params_sensor ON {table} (params_hash, sensor)")
+    return con
+
+#####################
+# WRITE             #
+#####################
+# inserts or updates rows (dicts with content_hash and the table columns) for one parameter set
+# lists/dicts (e.g. large_time_gaps) are stored as json, returns the number of rows written
+def upsert(path, table, rows, params):
+    columns = TABLES[table]
+    key = params_hash(params)
+    meta = [settings_key(params), datetime.now().isoformat(timespec="seconds")]
+    values = []
+    for row in rows:
+        cells = [row.get(c) for c in columns]
+        cells = [json.dumps(v, default=str) if isinstance(v, (list, dict)) else v for v in cells]
+        cells = [v.item() if hasattr(v, "item") else v for v in cells] # numpy scalars -> python
+        values.append([row["content_hash"], key] + cells + meta)
+    all_columns = KEY_COLUMNS + columns + META_COLUMNS
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns + META_COLUMNS)
+    with connect(path) as con: # commits on success
+        con.executemany(
+            f"INSERT INTO {table} ({', '.join(all_columns)}) VALUES ({', '.join('?' * len(all_columns))}) "
+            f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET {updates}",
+            values)
+    con.close()
+    return len(values)
+
+#####################
+# READ              #
+#####################
+# rows of a table as a DataFrame, optionally only one parameter set and/or some sensors
+def query(path, table, params=None, sensors=None):
+    where = []
+    args = []
+    if params is not None:
+        where.append("params_hash = ?")
+        args.append(params_hash(params))
+    if sensors is not None:
+        sensors = [str(s) for s in sensors]
+        where.append(f"sensor IN ({', '.join('?' * len(sensors))})")
+        args.extend(sensors)
+    sql = f"SELECT * FROM {table}" + (f" WHERE {' AND '.join(where)}" if where else "")
+    con = connect(path)
+    try:
+        return pd.read_sql_query(sql, con, params=args)
+    finally:
+        con.close()
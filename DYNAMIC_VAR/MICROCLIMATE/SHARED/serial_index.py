@@ -0,0 +1,83 @@
+# PURPOSE: PERSISTENT SERIAL -> FILE INDEX OF A CLF FOLDER, SO LOOKUPS BY SERIAL DO NOT LIST THE (SMB) FOLDER EVERY TIME
+#
+# one entry per CLF file: file, serial, date (download) and logger_type from parse_clf_name, other files are left out
+# the index is written to <folder>/clf_index.json together with the folder's mtime and kept in memory per process
+# adding, removing or renaming files changes the folder mtime, so a lookup only stats the folder and lists
+# and parses it again when the mtime differs from the index (or the index file is missing or unreadable)
+
+import os
+import json
+import pandas as pd
+from clf_io import list_clf_files, parse_clf_name
+
+INDEX_NAME = "clf_index.json"
+INDEX_COLUMNS = ["file", "serial", "date", "logger_type"]
+_INDEXES = {} # folder -> (mtime, index) of this process
+
+#####################
+# BUILD             #
+#####################
+# {serial: [entry, ...]} of all CLF files in folder, several files of one serial in file name order
+def build_index(folder):
+    index = {}
+    for file in list_clf_files(folder):
+        name = parse_clf_name(file)
+        if name is not None:
+            index.setdefault(name["serial"], []).append({"file": file, **name})
+    return index
+
+def _read_index(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# writes the index into folder and returns the folder mtime that belongs to it
+# creating clf_index.json changes the folder mtime, rewriting it in place does not, so the file is created first
+# and the mtime read after that. if the folder changed while it was listed, the mtime from before the listing is
+# kept so the next lookup rebuilds
+def _write_index(folder, index, listed_mtime):
+    path = os.path.join(folder, INDEX_NAME)
+    changed = os.stat(folder).st_mtime != listed_mtime
+    if not os.path.exists(path):
+        open(path, 'w').close()
+    mtime = listed_mtime if changed else os.stat(folder).st_mtime
+    with open(path, 'w', encoding="utf-8") as f: # a half written file fails to load and is rebuilt
+        json.dump({"mtime": mtime, "index": index}, f)
+    return mtime
+
+#####################
+# LOOKUP            #
+#####################
+# index of folder, from memory, from clf_index.json or rebuilt, whichever is still current
+# persist=False never writes the index file (read only folders), the index is then only kept in memory
+def load_index(folder, persist=True):
+    mtime = os.stat(folder).st_mtime
+    cached = _INDEXES.get(folder)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    stored = _read_index(os.path.join(folder, INDEX_NAME))
+    if stored is not None and stored.get("mtime") == mtime:
+        index = stored["index"]
+    else:
+        index = build_index(folder)
+        if persist:
+            try:
+                mtime = _write_index(folder, index, mtime)
+            except OSError: # no write access, keep it in memory only
+                pass
+    _INDEXES[folder] = (mtime, index)
+    return index
+
+# path of the (first) CLF file of serial in folder
+def find_by_serial(folder, serial):
+    entries = load_index(folder).get(str(serial))
+    if not entries:
+        raise FileNotFoundError(f"No {serial} in {folder}")
+    return os.path.join(folder, entries[0]["file"])
+
+# all indexed files of folder as a table (file, serial, date, logger_type), sorted by file name
+def index_table(folder):
+    rows = [entry for entries in load_index(folder).values() for entry in entries]
+    return pd.DataFrame(rows, columns=INDEX_COLUMNS).sort_values("file").reset_index(drop=True)
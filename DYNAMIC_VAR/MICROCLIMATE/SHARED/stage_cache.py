@@ -0,0 +1,177 @@
+# PURPOSE: CONTENT-ADDRESSED RESULT CACHE, LETS A STAGE SKIP FILES WHOSE INPUT, CODE AND PARAMETERS DID NOT CHANGE
+#
+# one entry per (input file content, stage code, parameter set):
+#   <cache folder>/<stage>/<key>/entry.pkl     stats of the run and the names of its output files
+#   <cache folder>/<stage>/<key>/<outputs>     the output files (cleaned CLF, figure, ...)
+# the key is a sha256 over the input file hash, code_version() of the stage and the parameters (incl. the file name,
+# outputs are named after the input). code_version() covers the stage script and only the SHARED modules it imports.
+# a hit puts the outputs back into the output folders and returns the stats
+#
+# outputs go into the cache and back out as hard links where the filesystem allows it, so a hit costs no copy of
+# large CLF / HTML files on the share. links fall back to copies across devices or where links are not supported.
+# a linked output that is later rewritten in place also changes the cached file, so every entry records size and
+# mtime of its files and an entry whose files changed is a miss (the stage runs again and stores a fresh entry)
+#
+# entries are written to a temp folder and renamed, so parallel workers never see half written entries
+# try_store() is store() for the stages: a failed cache write only prints a warning, the outputs are already written
+# evict() removes the least recently used entries until the cache fits its disk budget, call it once per run
+
+import os
+import ast
+import glob
+import pickle
+import shutil
+import hashlib
+from file_manifest import settings_key
+
+CACHE_BUDGET = 5 * 2**30 # bytes, least recently used entries are evicted above this
+ENTRY_NAME = "entry.pkl"
+SHARED_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+#####################
+# KEYS              #
+#####################
+# names of the SHARED modules a file imports, directly or through other SHARED modules
+def shared_imports(path, found=None):
+    found = set() if found is None else found
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            name = name.split(".")[0]
+            module_path = os.path.join(SHARED_FOLDER, f"{name}.py")
+            if name not in found and os.path.exists(module_path):
+                found.add(name)
+                shared_imports(module_path, found)
+    return found
+
+# sha256 of the stage script and the SHARED modules it uses, a change in any of them gives new keys
+# edits to SHARED modules the stage does not import keep its entries
+def code_version(script_path):
+    h = hashlib.sha256()
+    paths = [script_path] + [os.path.join(SHARED_FOLDER, f"{name}.py") for name in sorted(shared_imports(script_path))]
+    for path in paths:
+        h.update(os.path.basename(path).encode("utf-8"))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+# cache key of one input file, input_hash e.g. from results_store.content_hash
+def stage_key(input_hash, version, params):
+    return hashlib.sha256(f"{input_hash}|{version}|{settings_key(params)}".encode("utf-8")).hexdigest()
+
+def _entry_folder(cache_folder, stage, key):
+    return os.path.join(cache_folder, stage, key)
+
+#####################
+# STORE / RESTORE   #
+#####################
+# dst becomes a hard link to src, or a copy where that is not possible (other device, FAT, some SMB servers)
+# an existing dst is replaced, not written into, so files linked to it stay as they are
+# a dst that already is a link to src is left alone, renaming onto the same file would do nothing and leave tmp behind
+def _link_or_copy(src, dst):
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp = f"{dst}.{os.getpid()}.link"
+    if os.path.lexists(tmp): # left over from a run that stopped here
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    try:
+        os.replace(tmp, dst)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+# (size, mtime) of a cached file, a linked output rewritten in place changes it
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+# caches stats (any picklable object) and the output files {name: path}, missing outputs are skipped
+def store(cache_folder, stage, key, stats, outputs):
+    folder = _entry_folder(cache_folder, stage, key)
+    tmp = f"{folder}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp, exist_ok=True)
+        names = {}
+        stamps = {}
+        for name, path in outputs.items():
+            if path and os.path.exists(path):
+                _link_or_copy(path, os.path.join(tmp, name))
+                names[name] = os.path.basename(path)
+                stamps[name] = _stamp(os.path.join(tmp, name))
+        with open(os.path.join(tmp, ENTRY_NAME), 'wb') as f:
+            pickle.dump({"stats": stats, "outputs": names, "stamps": stamps}, f)
+        if os.path.exists(folder): # same key written by another worker, keep that one
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, folder)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return folder
+
+# store() that never fails the stage, the outputs are written at this point, only the entry is missing next time
+def try_store(cache_folder, stage, key, stats, outputs):
+    try:
+        return store(cache_folder, stage, key, stats, outputs)
+    except Exception as e:
+        print(f"WARNING: result not cached in {cache_folder} ({type(e).__name__}: {e})")
+        return None
+
+# links (or copies) the cached outputs into folders {name: folder} and returns (stats, {name: restored path})
+# None if the entry does not exist or its files changed since they were stored, so the caller runs the stage
+# and stores the result
+def restore(cache_folder, stage, key, folders):
+    folder = _entry_folder(cache_folder, stage, key)
+    entry_path = os.path.join(folder, ENTRY_NAME)
+    try:
+        with open(entry_path, 'rb') as f:
+            entry = pickle.load(f)
+        stamps = entry.get("stamps", {}) # entries from before the stamps were copies, always intact
+        for name in entry["outputs"]:
+            stamp = _stamp(os.path.join(folder, name))
+            if name in stamps and stamp != tuple(stamps[name]):
+                shutil.rmtree(folder, ignore_errors=True) # stale, the next store() writes a fresh entry
+                return None
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    restored = {}
+    for name, basename in entry["outputs"].items():
+        if name not in folders:
+            continue
+        os.makedirs(folders[name], exist_ok=True)
+        restored[name] = os.path.join(folders[name], basename)
+        _link_or_copy(os.path.join(folder, name), restored[name])
+    os.utime(entry_path) # last use, for the LRU eviction
+    return entry["stats"], restored
+
+#####################
+# EVICTION          #
+#####################
+# removes least recently used entries (all stages) until the cache is at most budget bytes, returns the number removed
+def evict(cache_folder, budget=CACHE_BUDGET):
+    entries = []
+    for entry_path in glob.glob(os.path.join(cache_folder, "*", "*", ENTRY_NAME)):
+        folder = os.path.dirname(entry_path)
+        size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+        entries.append((os.path.getmtime(entry_path), size, folder))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, folder in entries:
+        if total <= budget:
+            break
+        shutil.rmtree(folder, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed